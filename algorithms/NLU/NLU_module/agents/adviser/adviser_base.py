@@ -1,16 +1,89 @@
 # adviser_base.py
-import json
+import asyncio
+import functools
+import hashlib
+import importlib.util
 import logging
-import re
+import os
+import time
+from collections import OrderedDict
 from collections.abc import AsyncGenerator
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import TYPE_CHECKING, Optional
 
-import torch
-from NLU_module.source.model_definition import GPT_MODEL_NAME, gpt_client
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from NLU_module.source.model_definition import (
+    GPT_MODEL_NAME,
+    gpt_client,
+    llm_retry,
+    wait_rate_limit_cooldown,
+)
+from NLU_module.source.parse_utils import JsonObjectScanner, parse_llm_json
+
+if TYPE_CHECKING:
+    import torch
 
 logger = logging.getLogger(__name__)
 
+# 所有 Adviser 实例共享同一个 gpt_client, 用信号量限制同时在途的 LLM 请求数,
+# 防止 asyncio.gather 扇出时打爆 Azure 速率限制
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# 本地模型的 generate 是同步阻塞调用, 放到单线程执行器里跑: 不阻塞事件循环,
+# 同时保证同一时刻只有一个 generate 占用 GPU
+_gpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hf-generate")
+
+# 本地模型的动态批处理: 后台任务最多等待 HF_BATCH_WAIT_MS 毫秒凑齐 HF_BATCH_MAX_SIZE 个请求,
+# 左侧 padding 后合并为一次 generate, 并发请求共享同一次 GPU 前向
+HF_BATCH_MAX_SIZE = int(os.getenv("HF_BATCH_MAX_SIZE", "8"))
+HF_BATCH_WAIT_MS = float(os.getenv("HF_BATCH_WAIT_MS", "10"))
+
+# 低温度 LLM 调用的响应缓存 (进程内共享, LRU + TTL), 缓存原始文本, 命中时重新解析,
+# 避免调用方修改返回的 dict 污染缓存
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_TEMPERATURE = 0.3
+_response_cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+# 未指定 max_tokens 时的默认值: JSON 类调用输出都较短, 长文本 (行程/推荐) 需要更大的上限
+JSON_DEFAULT_MAX_TOKENS = 800
+TEXT_DEFAULT_MAX_TOKENS = 4000
+
+
+def _cache_key(model: str, temperature: float, max_tokens, prompt: str) -> str:
+    raw = f"{model}|{temperature}|{max_tokens}|{prompt}".encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, text = entry
+    if expires_at < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return text
+
+
+def _cache_put(key: str, text: str) -> None:
+    _response_cache[key] = (time.monotonic() + LLM_CACHE_TTL, text)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > LLM_CACHE_MAX_SIZE:
+        _response_cache.popitem(last=False)
+
+
+@functools.lru_cache(maxsize=64)
+def _build_guard(schema_hint: Optional[str]) -> str:
+    """ask_json 的提示词前缀 (按 schema_hint 缓存, 避免每次调用重复拼接)"""
+    if not schema_hint:
+        return "Return ONLY valid JSON.\n"
+    return (
+        f"Return ONLY valid JSON.\n\nFollow this JSON schema strictly:\n{schema_hint}\n"
+    )
+
 
 class AdviserBase:
     def __init__(self, model_name="gpt4o"):
@@ -20,28 +93,90 @@ class AdviserBase:
             self.model = GPT_MODEL_NAME
             print(f"Adviser initialized with Azure model: {self.model}")
         elif self.name == "deepseek":
+            # torch / transformers 只在本地模型分支按需导入, GPT 模式下不加载
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
             print("Loading DeepSeek model...")
             self.tokenizer = AutoTokenizer.from_pretrained(
                 "deepseek-ai/deepseek-llm-7b-chat", trust_remote_code=True
             )
             self.hf_model = AutoModelForCausalLM.from_pretrained(
                 "deepseek-ai/deepseek-llm-7b-chat",
-                torch_dtype=torch.float16
-                if torch.cuda.is_available()
-                else torch.float32,
-                device_map="auto",
+                **self._hf_load_kwargs(),
             )
+            # 显式开启 KV cache, 并设置 pad_token_id 避免 generate 时的 graph break
+            self.hf_model.generation_config.use_cache = True
+            self.hf_model.generation_config.pad_token_id = self.tokenizer.eos_token_id
+            self._tok_prefix_cache: dict[str, "torch.Tensor"] = {}
+            self._hf_queue: Optional[asyncio.Queue] = (
+                None  # 在首次调用时按当前事件循环创建
+            )
+            self._hf_batcher: Optional[asyncio.Task] = None
+            self._compile_hf_model()
         else:
             raise ValueError("Unsupported model name")
 
-    async def _chat(
+    @staticmethod
+    def _hf_load_kwargs() -> dict:
+        """
+        本地模型加载参数
+
+        有 GPU 且安装了 bitsandbytes 时使用 NF4 4-bit 权重量化 (激活保持 bf16),
+        解码时每个 token 读取的权重字节数约为 fp16 的 1/4; 否则退回 fp16/fp32.
+        """
+        import torch
+        from transformers import BitsAndBytesConfig
+
+        if not torch.cuda.is_available():
+            return {"torch_dtype": torch.float32, "device_map": "auto"}
+        if importlib.util.find_spec("bitsandbytes") is None:
+            logger.warning("未安装 bitsandbytes, DeepSeek 以 fp16 加载")
+            return {"torch_dtype": torch.float16, "device_map": "auto"}
+        return {
+            "quantization_config": BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4",
+            ),
+            "torch_dtype": torch.bfloat16,
+            "device_map": "auto",
+        }
+
+    def _compile_hf_model(self):
+        """
+        用 torch.compile 编译本地模型的 forward, 减少逐 token 解码的 Python 调度开销
+
+        编译代价在初始化时通过一次短生成预热支付; 部分 transformers 版本下
+        编译会失败, 此时回退到未编译的 forward.
+        """
+        import torch
+
+        eager_forward = self.hf_model.forward
+        try:
+            self.hf_model.forward = torch.compile(
+                eager_forward, mode="reduce-overhead", dynamic=True
+            )
+            warmup = self.tokenizer("Hello", return_tensors="pt")
+            if torch.cuda.is_available():
+                warmup = {k: v.to("cuda") for k, v in warmup.items()}
+            self.hf_model.generate(**warmup, max_new_tokens=8, use_cache=True)
+            print("DeepSeek model compiled with torch.compile")
+        except Exception as e:
+            self.hf_model.forward = eager_forward
+            logger.warning(f"torch.compile 失败, 使用未编译模型: {e}")
+
+    async def _chat_stream(
         self, prompt: str, temperature: float = 0.3, max_tokens: Optional[int] = None
-    ):
-        if self.name.startswith("gpt"):
-            # 默认 max_tokens, 对于长文本生成 (如行程) 使用更大的值
-            if max_tokens is None:
-                max_tokens = 4000
-            resp = await self.client.chat.completions.create(
+    ) -> AsyncGenerator[str, None]:
+        """
+        GPT 流式调用, 逐 chunk 返回文本
+
+        调用方提前结束迭代时需要用 contextlib.aclosing 包裹, 以便及时关闭底层 HTTP 流.
+        """
+        if max_tokens is None:
+            max_tokens = TEXT_DEFAULT_MAX_TOKENS
+        async with _llm_semaphore:
+            response = await self._create_completion(
                 model=self.model,
                 messages=[
                     {
@@ -52,19 +187,174 @@ class AdviserBase:
                 ],
                 temperature=temperature,
                 max_tokens=max_tokens,
+                stream=True,  # 启用流式输出
             )
-            if content := resp.choices[0].message.content:
-                return content.strip()
-            else:
-                return ""
+            try:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await response.close()
 
-        inputs = self.tokenizer(prompt, return_tensors="pt")
-        if torch.cuda.is_available():
-            inputs = {k: v.to("cuda") for k, v in inputs.items()}
+    @llm_retry
+    async def _create_completion(self, **kwargs):
+        """调用 chat.completions.create, 遇到 429 / 超时 / 5xx 时指数退避 + 抖动重试"""
+        await wait_rate_limit_cooldown()
+        return await self.client.chat.completions.create(**kwargs)
+
+    def _encode(self, prompt: str, prefix: str = "") -> dict:
+        """
+        本地模型的 tokenize, 静态前缀 (如 ask_json 的 schema guard) 的 input_ids 按前缀缓存,
+        每次只 tokenize 动态部分再拼接
+        """
+        import torch
+
+        if not prefix:
+            return self.tokenizer(prompt, return_tensors="pt")
+
+        prefix_ids = self._tok_prefix_cache.get(prefix)
+        if prefix_ids is None:
+            prefix_ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"]
+            self._tok_prefix_cache[prefix] = prefix_ids
+        suffix_ids = self.tokenizer(
+            prompt, add_special_tokens=False, return_tensors="pt"
+        )["input_ids"]
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=-1)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+    async def _chat(
+        self,
+        prompt: str,
+        temperature: float = 0.3,
+        max_tokens: Optional[int] = None,
+        prefix: str = "",
+    ):
+        if self.name.startswith("gpt"):
+            chunks = [
+                delta
+                async for delta in self._chat_stream(
+                    prefix + prompt, temperature, max_tokens
+                )
+            ]
+            return "".join(chunks).strip()
+
+        input_ids = self._encode(prompt, prefix)["input_ids"][0]
         # 对于本地模型, 如果指定了 max_tokens, 转换为 max_new_tokens
         max_new_tokens = max_tokens if max_tokens else 1500
-        outputs = self.hf_model.generate(**inputs, max_new_tokens=max_new_tokens)
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+        self._ensure_hf_batcher()
+        future = asyncio.get_running_loop().create_future()
+        await self._hf_queue.put((input_ids, max_new_tokens, future))
+        return await future
+
+    def _ensure_hf_batcher(self):
+        """
+        按需 (重新) 启动批处理后台任务
+
+        同一事件循环内重启时沿用原队列, 排队中的请求由新任务接着处理;
+        换了事件循环时旧队列无法再使用, 其中的请求以异常结束, 不留下永远等待的 future.
+        """
+        if self._hf_batcher is not None and not self._hf_batcher.done():
+            return
+        loop = asyncio.get_running_loop()
+        if self._hf_batcher is None or self._hf_batcher.get_loop() is not loop:
+            if self._hf_queue is not None:
+                self._fail_hf_queue(
+                    RuntimeError("本地模型批处理任务已在新的事件循环中重启")
+                )
+            self._hf_queue = asyncio.Queue()
+        self._hf_batcher = loop.create_task(self._hf_batch_loop())
+
+    def _fail_hf_queue(self, error: Exception):
+        """清空批处理队列, 其中尚未完成的请求以 error 结束"""
+        while not self._hf_queue.empty():
+            _, _, future = self._hf_queue.get_nowait()
+            if not future.done():
+                try:
+                    future.set_exception(error)
+                except RuntimeError:
+                    pass  # future 所属的事件循环已关闭, 不会再有人等待它
+
+    async def _hf_batch_loop(self):
+        """本地模型的批处理后台任务: 收集一批请求, 交给 GPU 执行器合并生成"""
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self._hf_queue.get()]
+                deadline = loop.time() + HF_BATCH_WAIT_MS / 1000
+                while len(batch) < HF_BATCH_MAX_SIZE:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(self._hf_queue.get(), timeout)
+                        )
+                    except TimeoutError:
+                        break
+
+                # 调用方已取消 (如请求超时) 的不再生成
+                batch = [item for item in batch if not item[2].done()]
+                if not batch:
+                    continue
+                try:
+                    texts = await loop.run_in_executor(
+                        _gpu_executor,
+                        self._generate_batch,
+                        [ids for ids, _, _ in batch],
+                        [n for _, n, _ in batch],
+                    )
+                except Exception as e:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, _, future), text in zip(batch, texts):
+                    if not future.done():
+                        future.set_result(text)
+        except BaseException:
+            # 任务被取消或意外退出: 已从队列取出但未完成的请求一并取消, 避免调用方永远等待
+            for _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+            raise
+
+    def _generate_batch(
+        self, prompts: list["torch.Tensor"], max_new_tokens: list[int]
+    ) -> list[str]:
+        """
+        左侧 padding 后一次 generate 生成整批 (在 GPU 执行器线程中运行)
+
+        生成长度取批内最大的 max_new_tokens, 每条结果再按各自的上限截断.
+        """
+        import torch
+
+        pad_id = self.tokenizer.eos_token_id
+        prompt_len = max(len(ids) for ids in prompts)
+        input_ids = torch.full((len(prompts), prompt_len), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        for i, ids in enumerate(prompts):
+            input_ids[i, prompt_len - len(ids) :] = ids
+            attention_mask[i, prompt_len - len(ids) :] = 1
+        if torch.cuda.is_available():
+            input_ids = input_ids.to("cuda")
+            attention_mask = attention_mask.to("cuda")
+
+        outputs = self.hf_model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max(max_new_tokens),
+            use_cache=True,
+            pad_token_id=pad_id,
+        )
+        # 只解码新生成的部分, 不把 prompt 本身带回给调用方
+        return [
+            self.tokenizer.decode(
+                outputs[i][prompt_len : prompt_len + n], skip_special_tokens=True
+            )
+            for i, n in enumerate(max_new_tokens)
+        ]
 
     async def ask_json(
         self,
@@ -73,29 +363,64 @@ class AdviserBase:
         temperature=0.2,
         max_tokens: Optional[int] = None,
     ):
-        guard = (
-            f"\nFollow this JSON schema strictly:\n{schema_hint}\n"
-            if schema_hint
-            else ""
+        if max_tokens is None:
+            max_tokens = JSON_DEFAULT_MAX_TOKENS
+        text = await self._cached_call(
+            self._chat_json,
+            prompt,
+            temperature,
+            max_tokens,
+            prefix=_build_guard(schema_hint),
         )
-        text = await self._chat(
-            "Return ONLY valid JSON.\n" + guard + prompt, temperature, max_tokens
-        )
-        try:
-            return json.loads(text)
-        except Exception:
-            match = re.search(r"\{[\s\S]*\}", text)
-            if match:
-                try:
-                    return json.loads(match.group(0))
-                except Exception:
-                    pass
-        return {"raw_text": text}
+        return parse_llm_json(text)
 
     async def ask_text(
         self, prompt: str, temperature=0.3, max_tokens: Optional[int] = None
     ):
-        return await self._chat(prompt, temperature, max_tokens)
+        return await self._cached_call(self._chat, prompt, temperature, max_tokens)
+
+    async def _cached_call(
+        self,
+        call,
+        prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        prefix: str = "",
+    ) -> str:
+        """低温度调用结果近似确定, 按 (模型, 温度, max_tokens, prompt) 缓存原始文本"""
+        if temperature > LLM_CACHE_MAX_TEMPERATURE:
+            return await call(prompt, temperature, max_tokens, prefix)
+
+        key = _cache_key(self.name, temperature, max_tokens, prefix + prompt)
+        if (text := _cache_get(key)) is not None:
+            logger.debug("LLM 响应缓存命中")
+            return text
+        text = await call(prompt, temperature, max_tokens, prefix)
+        if text:
+            _cache_put(key, text)
+        return text
+
+    async def _chat_json(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        prefix: str = "",
+    ) -> str:
+        if not self.name.startswith("gpt"):
+            return await self._chat(prompt, temperature, max_tokens, prefix)
+
+        # 流式接收, JSON 对象括号闭合后立即停止生成, 省掉多余的尾部 token
+        scanner = JsonObjectScanner()
+        chunks = []
+        async with aclosing(
+            self._chat_stream(prefix + prompt, temperature, max_tokens)
+        ) as stream:
+            async for delta in stream:
+                chunks.append(delta)
+                if scanner.feed(delta):
+                    break
+        return "".join(chunks).strip()
 
     async def ask_text_stream(
         self, prompt: str, temperature=0.3, max_tokens: Optional[int] = None
@@ -112,33 +437,11 @@ class AdviserBase:
             str: 每次生成的文本 chunk
         """
         if self.name.startswith("gpt"):
-            # 默认 max_tokens
-            if max_tokens is None:
-                max_tokens = 4000
-
             try:
                 logger.debug(f"开始流式调用 {self.model}, max_tokens={max_tokens}")
 
-                # 使用 Azure OpenAI 的流式 API
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a helpful travel assistant.",
-                        },
-                        {"role": "user", "content": prompt},
-                    ],
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    stream=True,  # 启用流式输出
-                )
-
-                # 逐 chunk 返回
-                async for chunk in response:
-                    if chunk.choices and chunk.choices[0].delta.content:
-                        delta = chunk.choices[0].delta.content
-                        yield delta
+                async for delta in self._chat_stream(prompt, temperature, max_tokens):
+                    yield delta
 
                 logger.debug("流式调用完成")
 
@@ -1,9 +1,11 @@
 # adviser_context.py
 from NLU_module.source.prompt import prompt_assemble_context
 
+CONTEXT_SUMMARY_SCHEMA_HINT = '{"summary":"string","highlights":["string"],"sources":[{"id":"string","title":"string","url":"string"}]}'
+
 
 async def run_context_summary(adviser, user_input, doc_summaries):
     return await adviser.ask_json(
         prompt_assemble_context(user_input, doc_summaries),
-        schema_hint='{"summary":"string","highlights":["string"],"sources":[{"id":"string","title":"string","url":"string"}]}',
+        schema_hint=CONTEXT_SUMMARY_SCHEMA_HINT,
     )
@@ -1,4 +1,6 @@
 # adviser_intent.py
+import asyncio
+import logging
 
 from NLU_module.source.prompt import (
     prompt_clarify,
@@ -7,6 +9,27 @@ from NLU_module.source.prompt import (
     prompt_query_rewrite,
 )
 
+logger = logging.getLogger(__name__)
+
+# 意图解析类 JSON 输出都很短 (<500 tokens), 收紧 max_tokens 以降低排队与尾延迟
+INTENT_MAX_TOKENS = 512
+
+INTENT_SCHEMA_HINT = """{
+  "task_type": "string",
+  "origin": "string or null",
+  "dest_pref": ["string"],
+  "date_window": {"from": "YYYY-MM-DD", "to": "YYYY-MM-DD"},
+  "trip_len_days": "number",
+  "budget_total_cny": "number",
+  "party": {"adults": "number", "children": "number"},
+  "tags": ["string"],"must_haves":["string"],
+  "missing_slots":["string"],"confidence":"number"}"""
+DATE_SCHEMA_HINT = (
+    '{"from":"YYYY-MM-DD","to":"YYYY-MM-DD","uncertainty":"boolean","reason":"string"}'
+)
+CLARIFY_SCHEMA_HINT = '{"questions":["string"],"suggestions":["string"]}'
+QUERY_REWRITE_SCHEMA_HINT = '{"keywords":["string"],"city_alias":["string"],"time_window":{"from":"YYYY-MM-DD","to":"YYYY-MM-DD"},"tags":["string"]}'
+
 
 async def run_intent_parsing(
     adviser, user_input: str, conversation_history: list | None = None, debug=False
@@ -18,47 +41,57 @@ async def run_intent_parsing(
     result = {}
     result["intent_parsed"] = await adviser.ask_json(
         prompt_parse_intent(user_input, conversation_history),
-        schema_hint="""{
-          "task_type": "string",
-          "origin": "string or null",
-          "dest_pref": ["string"],
-          "date_window": {"from": "YYYY-MM-DD", "to": "YYYY-MM-DD"},
-          "trip_len_days": "number",
-          "budget_total_cny": "number",
-          "party": {"adults": "number", "children": "number"},
-          "tags": ["string"],"must_haves":["string"],
-          "missing_slots":["string"],"confidence":"number"}""",
+        schema_hint=INTENT_SCHEMA_HINT,
+        max_tokens=INTENT_MAX_TOKENS,
     )
     if debug:
         print("• intent_parsed =", result["intent_parsed"])
 
+    # Step 2~4 只依赖 intent_parsed, 彼此独立, 并发执行以减少串行 RTT
+    intent_parsed = result["intent_parsed"]
+    tasks = {}
+
     # Step 2: 日期规范化
-    date_window = result["intent_parsed"].get("date_window", {})
+    date_window = intent_parsed.get("date_window")
     # 检查 date_window 是否有效：如果不存在、为 None，或者 from 和 to 都是 None/空，则需要规范化
-    needs_normalization = (
-        not date_window
-        or not isinstance(date_window, dict)
-        or (not date_window.get("from") and not date_window.get("to"))
+    needs_normalization = not (
+        isinstance(date_window, dict)
+        and (date_window.get("from") or date_window.get("to"))
     )
     if needs_normalization:
-        normalized_date = await adviser.ask_json(
+        tasks["date_window"] = adviser.ask_json(
             prompt_normalize_date(user_input),
-            schema_hint='{"from":"YYYY-MM-DD","to":"YYYY-MM-DD","uncertainty":"boolean","reason":"string"}',
+            schema_hint=DATE_SCHEMA_HINT,
+            max_tokens=INTENT_MAX_TOKENS,
         )
-        result["intent_parsed"]["date_window"] = normalized_date
 
     # Step 3: 澄清缺失信息
-    missing = result["intent_parsed"].get("missing_slots", [])
+    missing = intent_parsed.get("missing_slots", [])
     if missing:
-        result["clarification"] = await adviser.ask_json(
-            prompt_clarify(missing, result["intent_parsed"]),
-            schema_hint='{"questions":["string"],"suggestions":["string"]}',
+        tasks["clarification"] = adviser.ask_json(
+            prompt_clarify(missing, intent_parsed),
+            schema_hint=CLARIFY_SCHEMA_HINT,
+            max_tokens=INTENT_MAX_TOKENS,
         )
 
     # Step 4: Query 改写
-    result["query_rewrite"] = await adviser.ask_json(
-        prompt_query_rewrite(user_input, result["intent_parsed"]),
-        schema_hint='{"keywords":["string"],"city_alias":["string"],"time_window":{"from":"YYYY-MM-DD","to":"YYYY-MM-DD"},"tags":["string"]}',
+    tasks["query_rewrite"] = adviser.ask_json(
+        prompt_query_rewrite(user_input, intent_parsed),
+        schema_hint=QUERY_REWRITE_SCHEMA_HINT,
+        max_tokens=INTENT_MAX_TOKENS,
     )
 
+    outputs = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    for key, value in zip(tasks, outputs):
+        if isinstance(value, BaseException):
+            logger.error("%s 失败: %s", key, value)
+            continue
+        if key == "date_window":
+            intent_parsed["date_window"] = value
+        else:
+            result[key] = value
+
+    # query_rewrite 下游会直接 .get(), 失败时保证为 dict
+    result.setdefault("query_rewrite", {})
+
     return result
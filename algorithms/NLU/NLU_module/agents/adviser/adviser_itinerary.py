@@ -1,31 +1,32 @@
 # adviser_itinerary.py
 # -*- coding: utf-8 -*-
-import json
 import logging
 from collections.abc import AsyncGenerator
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
 
-async def generate_itinerary(adviser, result, rag_results, debug=False):
-    # 从意图里抓一些上下文（城市、日期等）
-    intent = result.get("intent_parsed", {}) if isinstance(result, dict) else {}
-    city = ""
-    start_date = ""
-    end_date = ""
-    days = ""
+def _dump_for_prompt(obj) -> str:
+    """序列化为嵌入 prompt 的 JSON 文本 (缩进 2, 保留非 ASCII 字符)"""
+    return orjson.dumps(
+        obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+    ).decode()
+
+
+def _prompt_context(result) -> dict:
+    """只保留行程 prompt 需要的意图字段, 避免序列化整个 result"""
+    if not isinstance(result, dict):
+        return {}
+    return {
+        "intent_parsed": result.get("intent_parsed", {}),
+        "query_rewrite": result.get("query_rewrite", {}),
+    }
 
-    try:
-        dests = intent.get("dest_pref", []) or []
-        city = dests[0] if dests else ""
-        date_window = intent.get("date_window", {}) or {}
-        start_date = date_window.get("from") or ""
-        end_date = date_window.get("to") or ""
-        days = intent.get("trip_len_days") or ""
-    except Exception:
-        pass
 
-    extra_context = """热门景点建议提前在官网预约购票
+# 行程 prompt 参考的票价 / 开放时间 / 省钱攻略
+_EXTRA_CONTEXT = """热门景点建议提前在官网预约购票
 需要预约的景点:
 卢浮宫(成人22欧, 提前7-15天预约)
 凡尔赛宫(旺季€32，提前3天)
@@ -50,13 +51,10 @@ async def generate_itinerary(adviser, result, rag_results, debug=False):
 注意：卢浮宫、凡尔赛持卡也需单独约时段
 """
 
-    # 长文生成 Prompt —— 强调「必须输出 Markdown 长文」
-    itinerary_prompt = f"""
-    你是一名**专业旅行策划师**。请根据下面的结构化意图和外部检索，生成**超详细的行程规划（中文 Markdown 长文）**：
-
-    - 目的地：{city or "目的地未识别（默认按巴黎示例）"}
-    - 行程时长：{days or "未明确（按 4~5 天示例）"} 天
-    - 日期区间（如有）：{start_date or "未给出"} ~ {end_date or "未给出"}
+# 行程 prompt 的静态部分 (角色, 写作要求, 参考资料, 结尾要求) 放在最前面, 每次调用逐字节相同,
+# 可以命中服务端的 prompt 前缀缓存; 城市 / 日期 / RAG / 意图等动态内容统一放在末尾
+_ITINERARY_PROMPT_HEAD = f"""
+    你是一名**专业旅行策划师**。请根据最后给出的行程信息、外部检索和结构化意图，生成**超详细的行程规划（中文 Markdown 长文）**。
 
     ## 写作要求（务必遵守）
     1) **按 Day 1 / Day 2 / Day 3 / Day 4 / Day 5...** 组织，每天**从 06:30 到 22:00** 给出连续时间轴（至少 4-5 个时间点），建议：06:30/08:00/09:30/11:00/12:30/14:00/15:30/17:00/18:30/20:00/21:30。
@@ -64,9 +62,8 @@ async def generate_itinerary(adviser, result, rag_results, debug=False):
     3) 交通写清楚**典型路线/地铁线编号**；用"→"表示换乘或步行衔接。
     4) **用现实可行的时长安排**（避免"三个小时逛完卢浮宫"这类不合理分配）。
     5) 结合以下**票价/开放时间/省钱攻略**尽量引用（如无数据则写"以官网为准"）：
-    {extra_context}
-    6) 若启用了 RAG，请**自然融合**检索的 1~2 条信息，不要生硬引用：  
-    {json.dumps(rag_results[:2], ensure_ascii=False, indent=2)}
+    {_EXTRA_CONTEXT}
+    6) 若启用了 RAG，请**自然融合**下方检索的 1~2 条信息，不要生硬引用。
 
     ## 结尾部分（务必包含）
     - **预算小结**（住宿/交通/餐饮/门票的区间）
@@ -74,11 +71,49 @@ async def generate_itinerary(adviser, result, rag_results, debug=False):
     - **博物馆通票/预约建议**
     - **独行旅客/亲子/雨天替代方案**
 
-    下方是结构化意图 JSON（仅供参考，不要照抄成列表）：
-    ```json
-    {json.dumps(result, ensure_ascii=False, indent=2)}
     只输出 Markdown 正文，不要再输出任何 JSON 或代码块围栏。 长度尽量达到约 1800~2500 字。
+"""
+
+
+def _build_itinerary_prompt(result, rag_results) -> str:
+    """静态前缀 + 本次请求的行程信息 / RAG 结果 / 结构化意图"""
+    # 从意图里抓一些上下文（城市、日期等）
+    intent = result.get("intent_parsed", {}) if isinstance(result, dict) else {}
+    city = ""
+    start_date = ""
+    end_date = ""
+    days = ""
+
+    try:
+        dests = intent.get("dest_pref", []) or []
+        city = dests[0] if dests else ""
+        date_window = intent.get("date_window", {}) or {}
+        start_date = date_window.get("from") or ""
+        end_date = date_window.get("to") or ""
+        days = intent.get("trip_len_days") or ""
+    except Exception:
+        pass
+
+    return (
+        _ITINERARY_PROMPT_HEAD
+        + f"""
+    ## 行程信息
+    - 目的地：{city or "目的地未识别（默认按巴黎示例）"}
+    - 行程时长：{days or "未明确（按 4~5 天示例）"} 天
+    - 日期区间（如有）：{start_date or "未给出"} ~ {end_date or "未给出"}
+
+    ## 外部检索（RAG）
+    {_dump_for_prompt(rag_results[:2])}
+
+    ## 结构化意图 JSON（仅供参考，不要照抄成列表）
+    {_dump_for_prompt(_prompt_context(result))}
     """
+    )
+
+
+async def generate_itinerary(adviser, result, rag_results, debug=False):
+    # 长文生成 Prompt —— 强调「必须输出 Markdown 长文」
+    itinerary_prompt = _build_itinerary_prompt(result, rag_results)
     # 关键：用 ask_text 让模型输出纯 Markdown 长文
     # 使用更大的 max_tokens 以确保能生成完整的长行程（1800-2500字约需要8000-12000 tokens）
     markdown = await adviser.ask_text(
@@ -107,77 +142,8 @@ async def generate_itinerary_stream(
     Yields:
         str: 每次生成的文本 chunk (Markdown 片段)
     """
-    # 从意图里抓一些上下文（城市、日期等）
-    intent = result.get("intent_parsed", {}) if isinstance(result, dict) else {}
-    city = ""
-    start_date = ""
-    end_date = ""
-    days = ""
-
-    try:
-        dests = intent.get("dest_pref", []) or []
-        city = dests[0] if dests else ""
-        date_window = intent.get("date_window", {}) or {}
-        start_date = date_window.get("from") or ""
-        end_date = date_window.get("to") or ""
-        days = intent.get("trip_len_days") or ""
-    except Exception:
-        pass
-
-    extra_context = """热门景点建议提前在官网预约购票
-需要预约的景点:
-卢浮宫(成人22欧, 提前7-15天预约)
-凡尔赛宫(旺季€32，提前3天)
-卢浮宫 开放时间: (周二闭馆)日常09:00-18:00, 周三和周五09:00-21:00 成人€22
-埃菲尔铁塔 09:00-23:00
-二层楼梯/电梯: €14.2/22.6，顶楼电梯/楼梯+电梯: 35.3欧/26.9欧
-凡尔赛宫 开放时间: (城堡周二至周日09:00-17:30(周一闭馆)，凡尔赛宫城堡价格€21
-奥赛博物馆 开放时间: (周二至周日09:30-18:00(周一闭馆)网上16欧，线下14欧
-圣礼拜堂 开放时间: 09:00-19:00  €13
-凯旋门  开放时间: (周三至周一10:00-23:00、周二11:00-23:00 €16
-橘园 开放时间: (9:00-18:00(周二闭馆) €16,提前3天
-巴黎歌剧院 开放时间: (10:00-17:00 €15，演出票€10-12
-巴黎迪士尼乐园 开放时间: (9:00-22:00 约€70~105
-枫丹白露宫 开放时间: (09:30-18:00(周二闭馆)€14
-曼特农城堡 开放时间: (10:30-18:00(周一闭馆)€8.5
-莫奈花园 开放时间: (9:30-18:00 €12.5
-
-——
-巴黎博物馆通票省钱攻略
-【Paris Museum Pass】找到官网买
-2日€70｜4日€90｜6日€110，覆盖50+景点
-注意：卢浮宫、凡尔赛持卡也需单独约时段
-"""
-
     # 长文生成 Prompt
-    itinerary_prompt = f"""
-    你是一名**专业旅行策划师**。请根据下面的结构化意图和外部检索，生成**超详细的行程规划（中文 Markdown 长文）**：
-
-    - 目的地：{city or "目的地未识别（默认按巴黎示例）"}
-    - 行程时长：{days or "未明确（按 4~5 天示例）"} 天
-    - 日期区间（如有）：{start_date or "未给出"} ~ {end_date or "未给出"}
-
-    ## 写作要求（务必遵守）
-    1) **按 Day 1 / Day 2 / Day 3 / Day 4 / Day 5...** 组织，每天**从 06:30 到 22:00** 给出连续时间轴（至少 4-5 个时间点），建议：06:30/08:00/09:30/11:00/12:30/14:00/15:30/17:00/18:30/20:00/21:30。
-    2) 每个时间点必须包含：**活动名称、地点、交通方式（地铁/步行/巴士/火车/游船等）、人均预算（€）、推荐餐饮、Tips（安全/文化/天气/礼仪）、"背景小知识/故事"**（1~2 句）。
-    3) 交通写清楚**典型路线/地铁线编号**；用"→"表示换乘或步行衔接。
-    4) **用现实可行的时长安排**（避免"三个小时逛完卢浮宫"这类不合理分配）。
-    5) 结合以下**票价/开放时间/省钱攻略**尽量引用（如无数据则写"以官网为准"）：
-    {extra_context}
-    6) 若启用了 RAG，请**自然融合**检索的 1~2 条信息，不要生硬引用：
-    {json.dumps(rag_results[:2], ensure_ascii=False, indent=2)}
-
-    ## 结尾部分（务必包含）
-    - **预算小结**（住宿/交通/餐饮/门票的区间）
-    - **交通与购票 Tips 汇总**
-    - **博物馆通票/预约建议**
-    - **独行旅客/亲子/雨天替代方案**
-
-    下方是结构化意图 JSON（仅供参考，不要照抄成列表）：
-    ```json
-    {json.dumps(result, ensure_ascii=False, indent=2)}
-    只输出 Markdown 正文，不要再输出任何 JSON 或代码块围栏。 长度尽量达到约 1800~2500 字。
-    """
+    itinerary_prompt = _build_itinerary_prompt(result, rag_results)
 
     if debug:
         logger.info("开始流式生成行程规划...")
@@ -2,7 +2,9 @@
 import asyncio
 import logging
 import time
-from typing import Any
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Final
 
 from .adviser_aggregate import run_aggregate
 from .adviser_base import AdviserBase
@@ -10,12 +12,41 @@ from .adviser_context import run_context_summary
 from .adviser_intent import run_intent_parsing
 from .adviser_itinerary import generate_itinerary
 from .adviser_plan_actions import run_plan_actions
-from .adviser_rag import call_rag_api
+from .adviser_rag import call_rag_api_cached
 from .adviser_recommendation import generate_recommendations
 from .clarifier import Clarifier
 
 logger = logging.getLogger(__name__)
 
+# RAG 检索用的中文城市名 -> 英文城市名映射
+CITY_MAP: Final[Mapping[str, str]] = MappingProxyType(
+    {
+        "巴黎": "Paris",
+        "伦敦": "London",
+        "东京": "Tokyo",
+        "大阪": "Osaka",
+        "香港": "Hong Kong",
+        "台北": "Taipei",
+        "曼谷": "Bangkok",
+        "首尔": "Seoul",
+        "悉尼": "Sydney",
+        "新加坡": "Singapore",
+        "吉隆坡": "Kuala Lumpur",
+        "巴塞罗那": "Barcelona",
+        "罗马": "Rome",
+        "上海": "Shanghai",
+        "北京": "Beijing",
+    }
+)
+
+
+def _dedup_ordered(items: list[Any]) -> list[Any]:
+    """按 str(item) 去重并保持首次出现的顺序 (dict 作为有序集合)"""
+    unique: dict[str, Any] = {}
+    for item in items:
+        unique.setdefault(str(item), item)
+    return list(unique.values())
+
 
 # adviser_main.py
 def merge_partial(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
@@ -40,10 +71,11 @@ def merge_partial(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
     if not old:
         return new or {}
 
-    out = dict(old)
+    # 写时复制: 只有某个字段真正发生变化时才复制 old, 无变化时直接返回 old
+    out = old
     for k, v in (new or {}).items():
         # 跳过空字段
-        if v in (None, "", [], {}):
+        if v is None or v == "" or (isinstance(v, (list, dict)) and not v):
             continue
         if k == "task_type":
             old_type = old.get("task_type", "")
@@ -57,10 +89,10 @@ def merge_partial(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
                 # 保留旧的 task_type
                 continue
             # 如果新的有明确的 task_type, 则使用新的
-            if new_type and new_type != "other":
-                out[k] = v
-            continue
-        if k == "dest_pref":
+            if not new_type or new_type == "other":
+                continue
+            merged = v
+        elif k == "dest_pref":
             prev = out.get(k) or []
             new_dests = v or []
 
@@ -69,33 +101,25 @@ def merge_partial(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
 
             if update_mode == "replace":
                 # 替换模式：直接使用新的目的地，丢弃旧的
-                out[k] = new_dests
+                merged = new_dests
             elif update_mode == "keep":
                 # 保持模式：不更新目的地，保留旧的
-                out[k] = prev
+                merged = prev
             else:  # append 或其他情况
                 # 追加模式：合并去重（原有逻辑）
-                seen, merged = set(), []
-                for item in prev + new_dests:
-                    s = str(item)
-                    if s not in seen:
-                        seen.add(s)
-                        merged.append(item)
-                out[k] = merged
-            continue
-        if isinstance(v, dict):
-            out[k] = {**out.get(k, {}), **v}
+                merged = _dedup_ordered(prev + new_dests)
+        elif isinstance(v, dict):
+            merged = {**out.get(k, {}), **v}
         elif isinstance(v, list):
-            prev = out.get(k) or []
-            seen, merged = set(), []
-            for item in prev + v:
-                s = str(item)
-                if s not in seen:
-                    seen.add(s)
-                    merged.append(item)
-            out[k] = merged
+            merged = _dedup_ordered((out.get(k) or []) + v)
         else:
-            out[k] = v
+            merged = v
+
+        if k in out and out[k] is merged:
+            continue
+        if out is old:
+            out = dict(old)
+        out[k] = merged
 
     return out
 
@@ -114,6 +138,7 @@ class Adviser:
         rag_top_k: int = 5,
         debug: bool = False,
         skip_clarifier: bool = False,
+        memory: dict[str, Any] | None = None,
     ) -> dict[str, Any]:
         """
         异步生成响应
@@ -125,11 +150,16 @@ class Adviser:
             rag_top_k: RAG 返回结果数量
             debug: 是否打印调试信息
             skip_clarifier: 是否跳过 Clarifier
+            memory: 会话记忆 (上一轮合并后的意图); 为 None 时读写 self.memory,
+                传入时不修改 self.memory, 本轮更新后的记忆即返回值中的 intent_parsed
 
         返回:
             包含 NLU 处理结果的字典
         """
         t0 = time.time()
+        stateful = memory is None
+        if stateful:
+            memory = self.memory
 
         # 1) parse intent for current user input
         result = (
@@ -139,98 +169,108 @@ class Adviser:
         intent_cur = result.get("intent_parsed", {})
 
         # 2️⃣ 合并历史上下文
-        intent_merged = merge_partial(self.memory, intent_cur)
+        intent_merged = merge_partial(memory, intent_cur)
         if not skip_clarifier:
             clarify_result = self.clarifier.clarify(user_input, intent_merged)
+            memory = clarify_result["revised_intent"]
+            if stateful:
+                self.memory = memory
             if not clarify_result["is_complete"]:
-                self.memory = clarify_result["revised_intent"]
                 return {
                     "need_more_info": True,
                     "follow_up": clarify_result["follow_up"],
-                    "intent_parsed": clarify_result["revised_intent"],
+                    "intent_parsed": memory,
                 }
 
             # 信息完整, 更新 memory
-            self.memory = clarify_result["revised_intent"]
-            result["intent_parsed"] = self.memory
+            result["intent_parsed"] = memory
         else:
             # 跳过 Clarifier, 直接用上次记忆
-            result["intent_parsed"] = self.memory
+            result["intent_parsed"] = memory
 
         task_type = result["intent_parsed"].get("task_type", "itinerary")
 
-        # RAG
-        if use_rag:
-            city_list = result["intent_parsed"].get("dest_pref", [])
-            city_raw = city_list[0] if city_list else ""
-            rewrite_alias = result.get("query_rewrite", {}).get("city_alias", [])
-            city_alias = rewrite_alias[0] if rewrite_alias else ""
-            city_map = {
-                "巴黎": "Paris",
-                "伦敦": "London",
-                "东京": "Tokyo",
-                "大阪": "Osaka",
-                "香港": "Hong Kong",
-                "台北": "Taipei",
-                "曼谷": "Bangkok",
-                "首尔": "Seoul",
-                "悉尼": "Sydney",
-                "新加坡": "Singapore",
-                "吉隆坡": "Kuala Lumpur",
-                "巴塞罗那": "Barcelona",
-                "罗马": "Rome",
-                "上海": "Shanghai",
-                "北京": "Beijing",
-            }
-            city = city_alias or city_map.get(city_raw, city_raw)
-
-            task_type = result["intent_parsed"].get("task_type", "itinerary")
-            tags = result["intent_parsed"].get("tags", []) or []
-            subtype = result["intent_parsed"].get("subtype", "")
-            keywords = result.get("query_rewrite", {}).get("keywords", [])
-
-            if task_type == "itinerary":
-                query_text = f"{city} attractions restrants hotels travel guide"
-            elif task_type == "recommendation":
-                category = subtype or (tags[0] if tags else "attractions")
-                query_text = f"{city} {category} recommendations"
-            elif task_type == "qa":
-                query_text = user_input.strip()
-            else:
-                query_text = (
-                    " ".join(keywords).strip() or user_input.strip() or "travel guide"
-                )
-
-            if debug:
-                print(
-                    f"🧭 [RAG Query 构造] 类型={task_type}, Query={query_text}, 城市={city}"
-                )
-
-            rag_results = await call_rag_api(query_text, city, rag_top_k, debug)
-
-            if debug:
-                print(f"🔍 [RAG 精简查询] Query: {query_text}")
-                print(f"✅ RAG 返回 {len(rag_results)} 条结果")
-
-            doc_summaries = [f"{r['title']}: {r['content'][:200]}" for r in rag_results]
-        else:
-            doc_summaries, rag_results = ["No external context."], []
-
-        # 并发执行独立的 LLM 调用 (阶段 1 优化)
+        # plan_actions / aggregate 只依赖 intent_parsed, 在 RAG 之前启动, 与 RAG 往返重叠
         logger.info("开始并发执行 context_summary, plan_steps, final_aggregation")
         t_concurrent_start = time.time()
+        pending: list[asyncio.Task] = []
+        try:
+            plan_task = asyncio.create_task(
+                run_plan_actions(self.llm, result["intent_parsed"])
+            )
+            aggregate_task = asyncio.create_task(
+                run_aggregate(self.llm, [], result["intent_parsed"])
+            )
+            pending += (plan_task, aggregate_task)
+
+            # RAG
+            if use_rag:
+                city_list = result["intent_parsed"].get("dest_pref", [])
+                city_raw = city_list[0] if city_list else ""
+                rewrite_alias = result.get("query_rewrite", {}).get("city_alias", [])
+                city_alias = rewrite_alias[0] if rewrite_alias else ""
+                city = city_alias or CITY_MAP.get(city_raw, city_raw)
+
+                task_type = result["intent_parsed"].get("task_type", "itinerary")
+                tags = result["intent_parsed"].get("tags", []) or []
+                subtype = result["intent_parsed"].get("subtype", "")
+                keywords = result.get("query_rewrite", {}).get("keywords", [])
+
+                if task_type == "itinerary":
+                    query_text = f"{city} attractions restrants hotels travel guide"
+                elif task_type == "recommendation":
+                    category = subtype or (tags[0] if tags else "attractions")
+                    query_text = f"{city} {category} recommendations"
+                elif task_type == "qa":
+                    query_text = user_input.strip()
+                else:
+                    query_text = (
+                        " ".join(keywords).strip()
+                        or user_input.strip()
+                        or "travel guide"
+                    )
+
+                if debug:
+                    print(
+                        f"🧭 [RAG Query 构造] 类型={task_type}, Query={query_text}, 城市={city}"
+                    )
+
+                rag_results, _ = await call_rag_api_cached(
+                    query_text, city, rag_top_k, debug
+                )
 
-        context_task = run_context_summary(self.llm, user_input, doc_summaries)
-        plan_task = run_plan_actions(self.llm, result["intent_parsed"])
-        aggregate_task = run_aggregate(self.llm, [], result["intent_parsed"])
+                if debug:
+                    print(f"🔍 [RAG 精简查询] Query: {query_text}")
+                    print(f"✅ RAG 返回 {len(rag_results)} 条结果")
+
+                doc_summaries = [
+                    title + ": " + content[:200]
+                    for title, content in (
+                        (r.get("title") or "", r.get("content") or "")
+                        for r in rag_results
+                    )
+                ]
+            else:
+                doc_summaries, rag_results = ["No external context."], []
 
-        # 使用 asyncio.gather 并发等待，并处理可能的异常
-        results = await asyncio.gather(
-            context_task,
-            plan_task,
-            aggregate_task,
-            return_exceptions=True,  # 不会因为单个任务失败而全部失败
-        )
+            # context_summary 依赖 RAG 结果, 与已在运行的 plan/aggregate 一起等待
+            context_task = asyncio.create_task(
+                run_context_summary(self.llm, user_input, doc_summaries)
+            )
+            pending.append(context_task)
+
+            # 使用 asyncio.gather 并发等待，并处理可能的异常
+            results = await asyncio.gather(
+                context_task,
+                plan_task,
+                aggregate_task,
+                return_exceptions=True,  # 不会因为单个任务失败而全部失败
+            )
+        except BaseException:
+            # RAG 查询出错或本轮被取消 (如请求超时) 时, 已启动的 LLM 调用一并取消, 不占用并发额度
+            for task in pending:
+                task.cancel()
+            raise
 
         # 检查每个结果并处理异常
         context_summary, plan_steps, final_aggregation = results
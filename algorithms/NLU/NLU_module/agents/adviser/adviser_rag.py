@@ -1,12 +1,56 @@
 # adviser_rag.py
+import asyncio
+import logging
 import os
+import time
+from collections import OrderedDict
 from typing import Any
 
 import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享的 RAG HTTP 客户端 (连接池复用, 避免每次调用重新建连)
+_client: httpx.AsyncClient | None = None
+_client_lock = asyncio.Lock()
+
+# RAG 结果缓存 (LRU + TTL): 热门城市的相同查询直接复用上次结果, 不再经过 HTTP + 向量编码;
+# 值存 orjson 序列化后的 bytes, 每次命中反序列化出新对象, 调用方修改结果不会污染缓存
+RAG_CACHE_MAX_SIZE = int(os.getenv("RAG_CACHE_MAX_SIZE", "256"))
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "300"))
+_rag_cache: OrderedDict[tuple, tuple[float, bytes]] = OrderedDict()
+
+
+async def _get_client() -> httpx.AsyncClient:
+    """懒加载共享的 AsyncClient"""
+    global _client
+    if _client is None:
+        async with _client_lock:
+            if _client is None:
+                _client = httpx.AsyncClient(
+                    timeout=15.0,
+                    limits=httpx.Limits(
+                        max_keepalive_connections=32, max_connections=64
+                    ),
+                )
+    return _client
+
+
+async def close_rag_client() -> None:
+    """关闭共享的 AsyncClient (服务关闭时调用)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
 async def call_rag_api(
-    query: str, city: str = "", top_k: int = 25, debug: bool = False
+    query: str,
+    city: str = "",
+    top_k: int = 25,
+    debug: bool = False,
+    content_max_chars: int | None = None,
 ) -> list[dict[str, Any]]:
     """
     异步调用 RAG API
@@ -16,56 +60,95 @@ async def call_rag_api(
         city: 城市名称
         top_k: 返回结果数量
         debug: 是否打印调试信息
+        content_max_chars: 让 RAG 服务端把每条 content 截断到该长度 (只需要摘要时使用), None 表示不截断
 
     Returns:
         RAG 检索结果列表
     """
     rag_url = os.getenv("RAG_API_URL", "http://127.0.0.1:8001/search")
     payload = {"query": query, "city": city or "", "top_k": int(top_k)}
+    if content_max_chars is not None:
+        payload["content_max_chars"] = int(content_max_chars)
 
-    # 总是打印 RAG 调用信息
-    print(f"🔍 正在调用 RAG API: {rag_url}")
-    print(f"   Query: {query[:100]}{'...' if len(query) > 100 else ''}")
-    print(f"   City: {city or '(未指定)'}, Top-K: {top_k}")
+    logger.info(
+        "🔍 正在调用 RAG API: %s | Query: %.100s | City: %s, Top-K: %d",
+        rag_url,
+        query,
+        city or "(未指定)",
+        top_k,
+    )
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(rag_url, json=payload, timeout=15.0)
-            resp.raise_for_status()
-            data = resp.json() if resp.content else {}
-            results = data.get("results", [])
-            if not results and "contexts" in data:
-                results = [{"title": "RAG Context", "content": data["contexts"]}]
-
-            # 总是打印结果数量
-            if results:
-                print(f"✅ RAG 调用成功: 获取到 {len(results)} 条结果")
-                if debug:
-                    for i, r in enumerate(results[:3], 1):
-                        title = r.get("title", "无标题")
-                        content_preview = r.get("content", "")[:100]
-                        print(f"   [{i}] {title}: {content_preview}...")
-            else:
-                print("⚠️ RAG 调用成功但未返回结果 (可能数据库为空或查询无匹配)")
-            return results
+        client = await _get_client()
+        resp = await client.post(rag_url, json=payload)
+        resp.raise_for_status()
+        data = orjson.loads(resp.content) if resp.content else {}
+        results = data.get("results", [])
+        if not results and "contexts" in data:
+            results = [{"title": "RAG Context", "content": data["contexts"]}]
+
+        if results:
+            logger.info("✅ RAG 调用成功: 获取到 %d 条结果", len(results))
+            if debug and logger.isEnabledFor(logging.DEBUG):
+                for i, r in enumerate(results[:3], 1):
+                    logger.debug(
+                        "   [%d] %s: %.100s...",
+                        i,
+                        r.get("title", "无标题"),
+                        r.get("content", ""),
+                    )
+        else:
+            logger.warning("⚠️ RAG 调用成功但未返回结果 (可能数据库为空或查询无匹配)")
+        return results
 
     except httpx.ConnectError as e:
-        print(f"❌ RAG API 连接失败: 无法连接到 {rag_url}")
-        print("   请确认 RAG 服务是否在运行 (默认端口 8001)")
+        logger.error(
+            "❌ RAG API 连接失败: 无法连接到 %s, 请确认 RAG 服务是否在运行 (默认端口 8001)",
+            rag_url,
+        )
         if debug:
-            print(f"   错误详情: {e}")
+            logger.debug("   错误详情: %s", e)
         return []
 
     except httpx.TimeoutException as e:
-        print("❌ RAG API 请求超时 (>15 秒)")
+        logger.error("❌ RAG API 请求超时 (>15 秒)")
         if debug:
-            print(f"   错误详情: {e}")
+            logger.debug("   错误详情: %s", e)
         return []
 
     except Exception as e:
-        print(f"❌ RAG 调用失败: {type(e).__name__}: {e}")
-        if debug:
-            import traceback
-
-            traceback.print_exc()
+        logger.error("❌ RAG 调用失败: %s: %s", type(e).__name__, e, exc_info=debug)
         return []
+
+
+async def call_rag_api_cached(
+    query: str,
+    city: str = "",
+    top_k: int = 25,
+    debug: bool = False,
+    content_max_chars: int | None = None,
+) -> tuple[list[dict[str, Any]], bool]:
+    """
+    带结果缓存的 call_rag_api
+
+    只缓存非空结果 (连接失败 / 超时返回的空列表不缓存).
+
+    Returns:
+        (RAG 检索结果列表, 是否命中缓存)
+    """
+    key = (query, city or "", int(top_k), content_max_chars)
+    if (entry := _rag_cache.get(key)) is not None:
+        expires_at, payload = entry
+        if expires_at >= time.monotonic():
+            _rag_cache.move_to_end(key)
+            logger.info("♻️  命中 RAG 结果缓存: %.100s", query)
+            return orjson.loads(payload), True
+        del _rag_cache[key]
+
+    results = await call_rag_api(query, city, top_k, debug, content_max_chars)
+    if results:
+        _rag_cache[key] = (time.monotonic() + RAG_CACHE_TTL, orjson.dumps(results))
+        _rag_cache.move_to_end(key)
+        while len(_rag_cache) > RAG_CACHE_MAX_SIZE:
+            _rag_cache.popitem(last=False)
+    return results, False
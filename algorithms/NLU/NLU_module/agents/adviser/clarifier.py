@@ -2,6 +2,75 @@
 from typing import Any, Dict, List
 
 
+def _is_empty(v) -> bool:
+    return v is None or v == ""
+
+
+def _missing_number(val) -> bool:
+    return val == 0
+
+
+# 按值的类型判断字段是否缺失 (LLM 解析出的 JSON 值只会是这些精确类型)
+_MISSING_BY_TYPE = {
+    str: lambda val: len(val.strip()) == 0,
+    list: lambda val: len(val) == 0,
+    dict: lambda val: all(_is_empty(v) for v in val.values()),
+    int: _missing_number,
+    float: _missing_number,
+    bool: _missing_number,
+}
+
+
+def _missing_generic(val) -> bool:
+    if val is None:
+        return True
+    check = _MISSING_BY_TYPE.get(type(val))
+    # 其他类型：使用默认检查
+    return check(val) if check else not val
+
+
+def _missing_date_window(val) -> bool:
+    # from / to 都为空才算缺失
+    if type(val) is dict:
+        return _is_empty(val.get("from")) and _is_empty(val.get("to"))
+    return _missing_generic(val)
+
+
+def _missing_party(val) -> bool:
+    # adults / children 都未给出才算缺失
+    if type(val) is dict:
+        return val.get("adults") is None and val.get("children") is None
+    return _missing_generic(val)
+
+
+# 各任务类型的必填字段
+_REQUIRED_BY_TASK = {
+    "itinerary": (
+        "origin",
+        "dest_pref",
+        "date_window",
+        "trip_len_days",
+        "budget_total_cny",
+        "party",
+    ),
+    "recommendation": ("dest_pref",),
+    "qa": ("question",),
+}
+
+# task_type 缺失时按用户输入中的关键词推断, 按顺序匹配, 先命中者优先
+_TASK_TYPE_KEYWORDS = (
+    ("itinerary", ("行程", "旅行", "trip", "itinerary", "计划")),
+    ("recommendation", ("推荐", "景点", "attraction", "recommend")),
+    ("qa", ("问题", "问", "how", "what", "why")),
+)
+
+# 需要特殊判断的字段, 其余字段使用 _missing_generic
+_MISSING_CHECKS = {
+    "date_window": _missing_date_window,
+    "party": _missing_party,
+}
+
+
 class Clarifier:
     def __init__(self):
         # 可扩展：未来可加入模型或外部规则加载
@@ -9,55 +78,12 @@ class Clarifier:
 
     def check_missing_info(self, intent: Dict[str, Any]) -> List[str]:
         task_type = intent.get("task_type") or intent.get("intent_type") or "other"
-        required_fields_by_task = {
-            "itinerary": [
-                "origin",
-                "dest_pref",
-                "date_window",
-                "trip_len_days",
-                "budget_total_cny",
-                "party",
-            ],
-            "recommendation": ["dest_pref"],
-            "qa": ["question"],
-        }
-        required = required_fields_by_task.get(task_type, [])
-        missing = []
-        for key in required:
-            val = intent.get(key)
-
-            # 检查字段是否缺失
-            is_missing = False
-
-            if val is None:
-                is_missing = True
-            elif isinstance(val, str):
-                # 字符串类型：检查是否为空
-                is_missing = len(val.strip()) == 0
-            elif isinstance(val, list):
-                is_missing = len(val) == 0
-            elif isinstance(val, dict):
-                if key == "date_window":
-                    from_val = val.get("from")
-                    to_val = val.get("to")
-                    is_missing = (from_val is None or from_val == "") and (
-                        to_val is None or to_val == ""
-                    )
-                elif key == "party":
-                    adults = val.get("adults")
-                    children = val.get("children")
-                    is_missing = (adults is None) and (children is None)
-                else:
-                    is_missing = all(v is None or v == "" for v in val.values())
-            elif isinstance(val, (int, float)):
-                is_missing = val == 0
-            else:
-                # 其他类型：使用默认检查
-                is_missing = not val
-
-            if is_missing:
-                missing.append(key)
-        return missing
+        required = _REQUIRED_BY_TASK.get(task_type, ())
+        return [
+            key
+            for key in required
+            if _MISSING_CHECKS.get(key, _missing_generic)(intent.get(key))
+        ]
 
     def generate_followup(self, missing: List[str]) -> str:
         if not missing:
@@ -79,16 +105,10 @@ class Clarifier:
     def auto_correct_task_type(self, intent: Dict[str, Any], user_input: str):
         task_type = intent.get("task_type", "")
         if task_type in ("other", "", None):
-            if any(
-                k in user_input for k in ["行程", "旅行", "trip", "itinerary", "计划"]
-            ):
-                task_type = "itinerary"
-            elif any(
-                k in user_input for k in ["推荐", "景点", "attraction", "recommend"]
-            ):
-                task_type = "recommendation"
-            elif any(k in user_input for k in ["问题", "问", "how", "what", "why"]):
-                task_type = "qa"
+            for candidate, keywords in _TASK_TYPE_KEYWORDS:
+                if any(k in user_input for k in keywords):
+                    task_type = candidate
+                    break
             intent["task_type"] = task_type
 
     def clarify(self, user_input: str, intent: Dict[str, Any]) -> Dict[str, Any]:
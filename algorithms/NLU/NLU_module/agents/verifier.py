@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
-import json
-import re
-
-from NLU_module.source.model_definition import GPT_MODEL_NAME, gpt_client
+import orjson
+from NLU_module.source.model_definition import (
+    GPT_MODEL_NAME,
+    gpt_client,
+    llm_retry,
+    wait_rate_limit_cooldown,
+)
 
 
 class Verifier:
@@ -11,8 +14,14 @@ class Verifier:
         self.model = GPT_MODEL_NAME
         print(f"✅ Verifier initialized with Azure model: {self.model}")
 
+    @llm_retry
+    async def _create_completion(self, **kwargs):
+        """调用 chat.completions.create, 遇到 429 / 超时 / 5xx 时指数退避 + 抖动重试"""
+        await wait_rate_limit_cooldown()
+        return await self.client.chat.completions.create(**kwargs)
+
     async def _ask(self, prompt: str):
-        response = await self.client.chat.completions.create(
+        response = await self._create_completion(
             model=self.model,
             messages=[
                 {
@@ -33,14 +42,22 @@ class Verifier:
         else:
             text = ""
 
-        # 自动解析 JSON 格式
+        # 自动解析 JSON 格式; 常见的 ```json 代码块包裹先直接切掉, 不进入下面的兜底扫描
+        body = text
+        if body.startswith("```"):
+            first_nl = body.find("\n")
+            fence_end = body.rfind("```")
+            if first_nl != -1 and fence_end > first_nl:
+                body = body[first_nl + 1 : fence_end]
         try:
-            return json.loads(text)
+            return orjson.loads(body)
         except Exception:
-            match = re.search(r"\{[\s\S]*\}", text)
-            if match:
+            # 取第一个 "{" 到最后一个 "}" 之间的内容 (与贪婪匹配 \{[\s\S]*\} 等价, 但无需正则)
+            start = text.find("{")
+            end = text.rfind("}")
+            if start != -1 and end > start:
                 try:
-                    return json.loads(match.group(0))
+                    return orjson.loads(text[start : end + 1])
                 except Exception:
                     pass
             return {"raw_text": text}
@@ -63,7 +80,7 @@ Return ONLY this JSON format:
 }}
 
 Plan to evaluate:
-{json.dumps(plan_json, ensure_ascii=False, indent=2)}
+{orjson.dumps(plan_json, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()}
         """
 
         result = await self._ask(prompt)
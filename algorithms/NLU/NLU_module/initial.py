@@ -1,19 +1,21 @@
 # -*- coding: utf-8 -*-
-from NLU_module.main import NLU
+import asyncio
+import sys
 
+from NLU_module.main import NLU, render_response
 
-def main():
+
+async def main():
     """主入口函数：启动问候 + 交互"""
-    print("你好！我是你的智能旅行助手。")
-    print("我可以帮你规划行程、推荐景点、安排美食或住宿。")
-    print("示例：")
-    print(
-        " - Plan a 4-day trip to Paris with museums and food experiences, budget 8000 yuan."
-    )
-    print(
-        " - Recommend top attractions and must-see places in Paris for first-time visitors."
+    sys.stdout.write(
+        "你好！我是你的智能旅行助手。\n"
+        "我可以帮你规划行程、推荐景点、安排美食或住宿。\n"
+        "示例：\n"
+        " - Plan a 4-day trip to Paris with museums and food experiences, budget 8000 yuan.\n"
+        " - Recommend top attractions and must-see places in Paris for first-time visitors.\n"
+        "————————————————————————————————————————————\n"
     )
-    print("————————————————————————————————————————————")
+    sys.stdout.flush()
 
     # 初始化系统
     nlu = NLU(with_verifier=True)
@@ -29,10 +31,13 @@ def main():
 
         print("正在思考，请稍候...\n")
         try:
-            _response = nlu.run(user_input)
+            response = await nlu.run(user_input)
         except Exception as e:
             print(f"出错啦: {e}")
+            continue
+        print(render_response(response))
 
 
 if __name__ == "__main__":
-    main()
+    # 整个交互循环跑在同一个事件循环里, 共享的 httpx 客户端 / 信号量始终绑定同一个 loop
+    asyncio.run(main())
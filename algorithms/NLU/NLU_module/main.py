@@ -1,119 +1,384 @@
 # -*- coding: utf-8 -*-
-import json
+import asyncio
+import atexit
+import hashlib
+import logging
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 
-import aiofiles
+import orjson
 from NLU_module.agents.adviser.adviser_main import Adviser
 from NLU_module.agents.verifier import Verifier
 
+logger = logging.getLogger(__name__)
 
-class NLU:
-    def __init__(
-        self, log_folder="log", file_name="0", with_verifier=True, max_retries=3
-    ):
+# 日志写入由单个后台线程完成: run() 只把 (文件句柄, 文本) 放入队列, 不在请求路径上做磁盘 I/O
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_writer: threading.Thread | None = None
+_log_writer_lock = threading.Lock()
+
+# 会话内保留的最近对话轮数 (滑动窗口), 避免长会话的 history 无限增长
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "20"))
+
+# Adviser 响应缓存 (进程内跨会话共享, LRU + TTL): 键包含输入/历史/记忆, 实际命中多为不同会话的相同首条请求;
+# 缓存序列化后的 bytes, 命中时重新解析, 避免调用方修改返回的 dict 污染缓存
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "128"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+_response_cache: OrderedDict[bytes, tuple[float, bytes]] = OrderedDict()
+
+# Verifier 重试循环的总时间预算 (秒), 超过后不再发起新一轮重新生成
+VERIFY_RETRY_BUDGET = float(os.getenv("VERIFY_RETRY_BUDGET", "20"))
+
+
+def _response_cache_key(user_input, conversation_history, memory, use_rag, rag_top_k):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{use_rag}|{rag_top_k}|{user_input}|".encode())
+    h.update(orjson.dumps(conversation_history, option=orjson.OPT_SORT_KEYS))
+    h.update(orjson.dumps(memory, option=orjson.OPT_SORT_KEYS))
+    return h.digest()
+
+
+def _normalize_explanation(explanation) -> str:
+    """归一化 Verifier 的问题说明 (合并空白, 忽略大小写), 用于判断两轮是否给出相同结论"""
+    return " ".join(str(explanation).split()).casefold()
+
+
+def _dumps_log(obj) -> str:
+    """日志用的紧凑 JSON (保留非 ASCII 字符)"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _drain_log_queue():
+    """后台写线程: 队列为空时统一 flush; 收到 None 时 flush 后退出, payload 为 None 表示关闭句柄"""
+    dirty = set()
+    while True:
+        item = _log_queue.get()
+        if item is None:
+            break
+        fh, payload = item
+        try:
+            if payload is None:
+                dirty.discard(fh)
+                fh.close()
+            else:
+                fh.write(payload)
+                dirty.add(fh)
+            if _log_queue.empty():
+                for f in dirty:
+                    f.flush()
+                dirty.clear()
+        except Exception:
+            logger.exception("写入日志失败")
+    for f in dirty:
+        f.flush()
+
+
+def _stop_log_writer():
+    """进程退出时写完队列中剩余的日志"""
+    if _log_writer is not None:
+        _log_queue.put(None)
+        _log_writer.join(timeout=5)
+
+
+def _ensure_log_writer():
+    global _log_writer
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = threading.Thread(
+                target=_drain_log_queue, name="nlu-log-writer", daemon=True
+            )
+            _log_writer.start()
+            atexit.register(_stop_log_writer)
+
+
+class NLUSession:
+    """
+    单个会话的可变状态: 对话历史, 首轮标记, 意图记忆和日志句柄
+
+    Adviser / Verifier 等重量级对象由 NLUEngine 在所有会话间共享, 会话本身只保留这些轻量数据.
+    """
+
+    __slots__ = (
+        "session_id",
+        "path",
+        "history",
+        "conv_history",
+        "memory",
+        "init",
+        "last_active",
+        "log_path",
+        "history_path",
+        "lock",
+        "_log_fh",
+        "_hist_fh",
+        "_log_buf",
+    )
+
+    def __init__(self, log_folder="log", file_name="0"):
+        self.session_id = file_name  # 保存 session_id 用于日志
         self.path = f"NLU_module/{log_folder}/{file_name}"
         self.history = []
+        self.conv_history = []  # history 的精简投影, 作为 conversation_history 传给 Adviser
+        self.memory: dict = {}  # 上一轮合并后的意图, 传给 Adviser.generate_response
+        self.init = True
+        self.last_active = time.monotonic()  # 最近一次访问时间, 供会话缓存做 TTL 淘汰
+
+        # 初始化日志路径
+        os.makedirs(self.path, exist_ok=True)
+        self.log_path = f"{self.path}/log.txt"
+        self.history_path = f"{self.path}/history.txt"
+
+        # 日志文件句柄在会话生命周期内保持打开 (64KB 缓冲, 一轮的日志通常一次系统调用写完), 由后台线程写入;
+        # "a" 模式不存在则创建，存在则追加（不清空，保留历史）
+        self._log_fh = open(self.log_path, "a", encoding="utf-8", buffering=1 << 16)
+        self._log_buf: list[str] = []  # 本轮待写入 log.txt 的片段, 每轮合并为一次写入
+        self._hist_fh = open(
+            self.history_path, "a", encoding="utf-8", buffering=1 << 16
+        )
+        _ensure_log_writer()
+
+        # 同一会话的多个请求按顺序执行, 避免并发修改 history / init / memory
+        self.lock = asyncio.Lock()
+
+    def _remember(self, user_input, response):
+        """记录一轮对话, 同步追加精简后的历史对话上下文, 只保留最近 HISTORY_MAX_TURNS 轮"""
+        self.history.append({"user": user_input, "response": response})
+        self.conv_history.append(
+            {
+                "user": user_input,
+                "response": {"intent_parsed": response.get("intent_parsed", {})},
+            }
+        )
+        if len(self.history) > HISTORY_MAX_TURNS:
+            del self.history[:-HISTORY_MAX_TURNS]
+            del self.conv_history[:-HISTORY_MAX_TURNS]
+
+    def _write(self, fh, payload: str):
+        """把日志文本交给后台写线程, 不阻塞事件循环"""
+        _log_queue.put((fh, payload))
+
+    def _log(self, text: str):
+        """追加一段 log.txt 内容, 由 _flush_log 在本轮结束时合并写出"""
+        self._log_buf.append(text)
+
+    def _flush_log(self):
+        if self._log_buf:
+            self._write(self._log_fh, "".join(self._log_buf))
+            self._log_buf.clear()
+
+    def close(self):
+        """关闭日志文件句柄 (在后台线程写完已排队的日志之后), 并丢弃内存中的对话历史"""
+        self._flush_log()
+        self._write(self._log_fh, None)
+        self._write(self._hist_fh, None)
+        self.history.clear()
+        self.conv_history.clear()
+
+
+class NLUEngine:
+    """
+    NLU 处理引擎: 持有 Adviser / Verifier, 无会话状态, 可被任意多个 NLUSession 共享
+
+    会话相关的数据全部通过 run(session, ...) 传入.
+    """
+
+    def __init__(self, with_verifier=True, max_retries=3, regen_candidates=1):
         self.with_verifier = with_verifier
-        self.session_id = file_name  # 保存 session_id 用于日志
         self.max_retries = max_retries  # Verifier 最大重试次数
+        # 每轮重试并行生成的候选数 (>1 时以更多 token 换取更少的重试轮数)
+        self.regen_candidates = max(1, regen_candidates)
 
         # 初始化模型
         self.adviser = Adviser(model_name="gpt4o")  # 或 'deepseek'
         if self.with_verifier:
             self.verifier = Verifier()  # GPT-4o
 
-        # 初始化日志路径
-        os.makedirs(self.path, exist_ok=True)
-        self.log_path = f"{self.path}/log.txt"
-        self.history_path = f"{self.path}/history.txt"
+    async def _generate(
+        self, session, user_input, conversation_history, use_rag, rag_top_k=25
+    ):
+        """
+        调用 Adviser 生成响应, 相同的 (输入, 历史, 记忆, RAG 参数) 直接返回缓存结果
 
-        # 如果文件不存在则创建，存在则追加（不清空，保留历史）
-        if not os.path.exists(self.log_path):
-            open(self.log_path, "w").close()
-        if not os.path.exists(self.history_path):
-            open(self.history_path, "w").close()
+        无论是否命中, 会话的 memory 都更新为响应中的 intent_parsed, 与 Adviser 的记忆语义一致.
+        """
+        try:
+            key = _response_cache_key(
+                user_input,
+                conversation_history,
+                session.memory,
+                use_rag,
+                rag_top_k,
+            )
+        except TypeError:
+            key = None
 
-        self.init = True
+        if key is not None and (entry := _response_cache.get(key)) is not None:
+            expires_at, payload = entry
+            if expires_at >= time.monotonic():
+                _response_cache.move_to_end(key)
+                response = orjson.loads(payload)
+                session.memory = response.get("intent_parsed", {})
+                logger.info("♻️  命中 Adviser 响应缓存")
+                return response
+            del _response_cache[key]
 
-    async def run(self, contents, context=None):
-        user_input = contents
+        response = await self.adviser.generate_response(
+            user_input,
+            conversation_history=conversation_history,
+            use_rag=use_rag,
+            rag_top_k=rag_top_k,
+            debug=True,
+            skip_clarifier=False,
+            memory=session.memory,
+        )
+        session.memory = response.get("intent_parsed", {})
+        if key is not None:
+            try:
+                payload = orjson.dumps(response, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                return response
+            _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, payload)
+            _response_cache.move_to_end(key)
+            while len(_response_cache) > RESPONSE_CACHE_MAX_SIZE:
+                _response_cache.popitem(last=False)
+        return response
 
-        print("________________________________________")
-        print(f"🧠 User Input: {user_input}")
-
-        # 准备历史对话上下文（只包含用户输入和响应，不包含内部结构）
-        conversation_history = []
-        if self.history:
-            for h in self.history:
-                conv_turn = {
-                    "user": h.get("user", ""),
-                    "response": {
-                        "intent_parsed": h.get("response", {}).get("intent_parsed", {})
-                    },
-                }
-                conversation_history.append(conv_turn)
-
-        # 第一次调用 Adviser
-        if self.init:
-            response = await self.adviser.generate_response(
-                user_input,
+    async def _regenerate(
+        self, session: "NLUSession", revision_prompt: str, conversation_history
+    ) -> tuple[dict, str, bool]:
+        """
+        并行生成 regen_candidates 个修正候选, 各自生成后立即审查
+
+        取第一个通过审查的候选并取消其余的; 都未通过时取最先完成的候选及其问题说明.
+        生成或审查失败的候选直接丢弃, 全部失败时抛出最后一个异常.
+
+        Returns:
+            (候选响应, 问题说明, 是否通过)
+        """
+
+        async def generate_and_verify():
+            # 重新生成时也传递历史对话
+            candidate = await self.adviser.generate_response(
+                revision_prompt,
                 conversation_history=conversation_history,
                 use_rag=True,
                 rag_top_k=25,
                 debug=True,
-                skip_clarifier=False,
+                memory=session.memory,
             )
-            self.init = False
-        else:
-            # 非首次：正常调用，关掉 debug，但传递历史对话
-            response = await self.adviser.generate_response(
-                user_input,
-                conversation_history=conversation_history,
-                use_rag=False,
-                rag_top_k=25,
-                debug=True,
-                skip_clarifier=False,
+            cand_explanation, cand_safe = await self.verifier.assess_cur_response(
+                candidate
             )
-        # 保存 Adviser 输出
-        async with aiofiles.open(self.log_path, "a+", encoding="utf-8") as f:
-            await f.write(
-                f"\n----------------------- User -----------------------\n{user_input}\n"
+            session._log(
+                f"\n----------------------- Regenerated Response -----------------------\n{_dumps_log(candidate)}\n"
+                f"Safety: {cand_safe}\nExplanation: {cand_explanation}\n",
             )
-            await f.write(
-                f"----------------------- Adviser Response -----------------------\n{json.dumps(response, ensure_ascii=False, indent=2)}\n"
+            return candidate, cand_explanation, cand_safe
+
+        tasks = [
+            asyncio.create_task(generate_and_verify())
+            for _ in range(self.regen_candidates)
+        ]
+        chosen = None
+        error = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    outcome = await next_done
+                except Exception as e:
+                    logger.warning("⚠️ 重新生成的候选失败: %s", e)
+                    error = e
+                    continue
+                if chosen is None or outcome[2]:
+                    chosen = outcome
+                if outcome[2]:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+        if chosen is None:
+            raise error
+        return chosen
+
+    async def run(self, session: "NLUSession", contents, context=None):
+        user_input = contents
+
+        logger.info("[%s] 🧠 User Input: %s", session.session_id, user_input)
+
+        # 历史对话上下文（只包含用户输入和意图，不包含内部结构），随 history 增量维护
+        conversation_history = session.conv_history
+
+        # 第一次调用 Adviser 使用 RAG; 非首次：正常调用，但传递历史对话
+        response = await self._generate(
+            session, user_input, conversation_history, use_rag=session.init
+        )
+        session.init = False
+        # 需要审查时先把 Verifier 请求发出去, 日志序列化等本地工作与其网络等待重叠
+        # task_type 每轮只取一次
+        task_type = (response.get("intent_parsed") or {}).get("task_type", "")
+        verify_task = None
+        if (
+            self.with_verifier
+            and task_type == "itinerary"
+            and not response.get("need_more_info")
+        ):
+            verify_task = asyncio.create_task(
+                self.verifier.assess_cur_response(response)
             )
+            await asyncio.sleep(0)
+
+        # 保存 Adviser 输出
+        session._log(
+            f"\n----------------------- User -----------------------\n{user_input}\n"
+            f"----------------------- Adviser Response -----------------------\n{_dumps_log(response)}\n",
+        )
 
         # ✅ 如果需要补充信息，直接输出追问并返回（不走 Verifier）
         if response.get("need_more_info"):
-            follow_up = response.get("follow_up", "我还需要一些补充信息～")
-            print("🤔 需要补充信息：\n")
-            print(follow_up)
+            logger.info("[%s] 🤔 需要补充信息", session.session_id)
             # 记录历史
-            self.history.append({"user": user_input, "response": response})
-            async with aiofiles.open(self.history_path, "a+", encoding="utf-8") as f:
-                await f.write(f"\n------------ User ------------\n{user_input}\n")
-                await f.write(
-                    f"------------ Response ------------\n{json.dumps(response, ensure_ascii=False, indent=2)}\n"
-                )
-            print("\n****************************************")
+            session._remember(user_input, response)
+            session._write(
+                session._hist_fh,
+                f"\n------------ User ------------\n{user_input}\n"
+                f"------------ Response ------------\n{_dumps_log(response)}\n",
+            )
+            session._flush_log()
             return response
 
         # 调用 Verifier 审查
-        task_type = response.get("intent_parsed", {}).get("task_type", "")
-        if self.with_verifier and task_type == "itinerary":
-            explanation, is_safe = await self.verifier.assess_cur_response(response)
-            async with aiofiles.open(self.log_path, "a+", encoding="utf-8") as f:
-                await f.write(
-                    "\n&&&&&&&&&&&&&&&&&&&&&&& Safety Check &&&&&&&&&&&&&&&&&&&&&&&\n"
-                )
-                await f.write(f"Safety: {is_safe}\nExplanation: {explanation}\n")
+        if verify_task is not None:
+            explanation, is_safe = await verify_task
+            session._log(
+                "\n&&&&&&&&&&&&&&&&&&&&&&& Safety Check &&&&&&&&&&&&&&&&&&&&&&&\n"
+                f"Safety: {is_safe}\nExplanation: {explanation}\n",
+            )
 
-            # 如果不安全，重新生成（带重试次数限制）
+            # 如果不安全，重新生成（带重试次数和时间预算限制）
             retry_count = 0
+            retry_deadline = time.monotonic() + VERIFY_RETRY_BUDGET
+            last_explanation = None
             while not is_safe and retry_count < self.max_retries:
+                # 连续两轮问题说明相同, 说明重新生成没有解决问题, 继续重试大概率不会收敛
+                cur_explanation = _normalize_explanation(explanation)
+                if cur_explanation == last_explanation:
+                    logger.warning("⚠️ Verifier 连续给出相同的问题说明, 提前结束重试")
+                    break
+                if time.monotonic() >= retry_deadline:
+                    logger.warning(
+                        "⚠️ Verifier 重试已超过时间预算 (%.0fs), 提前结束重试",
+                        VERIFY_RETRY_BUDGET,
+                    )
+                    break
+                last_explanation = cur_explanation
                 retry_count += 1
-                print(
-                    f"⚠️ Verifier 检测到问题，正在重新生成... (第 {retry_count}/{self.max_retries} 次)"
+                logger.warning(
+                    "⚠️ Verifier 检测到问题，正在重新生成... (第 %d/%d 次)",
+                    retry_count,
+                    self.max_retries,
                 )
                 revision_prompt = f"""原始用户请求：{user_input}
 
@@ -121,93 +386,124 @@ class NLU:
 {explanation}
 
 请保持原始请求的意图（task_type、目的地、天数、预算等），只修正检测到的问题。"""
-                # 重新生成时也传递历史对话
-                conversation_history = []
-                if self.history:
-                    for h in self.history:
-                        conv_turn = {
-                            "user": h.get("user", ""),
-                            "response": {
-                                "intent_parsed": h.get("response", {}).get(
-                                    "intent_parsed", {}
-                                )
-                            },
-                        }
-                        conversation_history.append(conv_turn)
-                response = await self.adviser.generate_response(
-                    revision_prompt,
-                    conversation_history=conversation_history,
-                    use_rag=True,
-                    rag_top_k=25,
-                    debug=True,
+                response, explanation, is_safe = await self._regenerate(
+                    session, revision_prompt, conversation_history
                 )
-                explanation, is_safe = await self.verifier.assess_cur_response(response)
-
-                async with aiofiles.open(self.log_path, "a+", encoding="utf-8") as f:
-                    await f.write(
-                        f"\n----------------------- Regenerated Response -----------------------\n{json.dumps(response, ensure_ascii=False, indent=2)}\n"
-                    )
-                    await f.write(f"Safety: {is_safe}\nExplanation: {explanation}\n")
+                session.memory = response.get("intent_parsed", session.memory)
 
-            # 如果达到最大重试次数仍未通过验证, 发出警告
+            # 重试结束仍未通过验证, 发出警告
             if not is_safe:
-                print(
-                    f"⚠️ 警告: 已达到最大重试次数 ({self.max_retries}), 但方案仍存在问题. 返回最后一次生成的结果."
+                logger.warning(
+                    "⚠️ 警告: 已重试 %d/%d 次, 但方案仍存在问题. 返回最后一次生成的结果.",
+                    retry_count,
+                    self.max_retries,
+                )
+                session._log(
+                    f"\n⚠️ 警告: 重试 {retry_count} 次后仍未通过, 最终状态: is_safe={is_safe}\n",
                 )
-                async with aiofiles.open(self.log_path, "a+", encoding="utf-8") as f:
-                    await f.write(
-                        f"\n⚠️ 警告: 已达到最大重试次数, 最终状态: is_safe={is_safe}\n"
-                    )
         else:
-            print("Recommendation-type task detected: Skipping Verifier check.")
+            logger.debug("Recommendation-type task detected: Skipping Verifier check.")
 
         # 更新历史记录
-        self.history.append({"user": user_input, "response": response})
-        async with aiofiles.open(self.history_path, "a+", encoding="utf-8") as f:
-            await f.write(f"\n------------ User ------------\n{user_input}\n")
-            await f.write(
-                f"------------ Response ------------\n{json.dumps(response, ensure_ascii=False, indent=2)}\n"
-            )
+        session._flush_log()
+        session._remember(user_input, response)
+        session._write(
+            session._hist_fh,
+            f"\n------------ User ------------\n{user_input}\n"
+            f"------------ Response ------------\n{_dumps_log(response)}\n",
+        )
 
-        task_type = response.get("intent_parsed", {}).get("task_type", "")
+        return response
+
+
+class NLU:
+    """
+    单会话封装 (命令行和 /nlu 接口使用): 一个 NLUEngine 加一个 NLUSession
+
+    传入 engine 时复用已有引擎, 否则新建一个.
+    """
+
+    def __init__(
+        self,
+        log_folder="log",
+        file_name="0",
+        with_verifier=True,
+        max_retries=3,
+        regen_candidates=1,
+        engine: NLUEngine | None = None,
+    ):
+        self.engine = engine or NLUEngine(
+            with_verifier=with_verifier,
+            max_retries=max_retries,
+            regen_candidates=regen_candidates,
+        )
+        self.session = NLUSession(log_folder=log_folder, file_name=file_name)
+
+    @property
+    def adviser(self):
+        return self.engine.adviser
+
+    @property
+    def lock(self):
+        return self.session.lock
+
+    async def run(self, contents, context=None):
+        return await self.engine.run(self.session, contents, context)
+
+    def close(self):
+        self.session.close()
 
-        # ---------------- 行程类任务 ----------------
-        if task_type == "itinerary":
-            md = response.get("itinerary_markdown") or response.get(
-                "detailed_itinerary", {}
-            ).get("itinerary_markdown")
-            if md:
-                print("行程规划：\n")
-                print(md.strip())
-            else:
-                # 兜底：如果没生成文，就退回到 detail 提取版
-                detailed_itinerary = response.get("detailed_itinerary", {}).get(
-                    "itinerary", {}
-                )
-                if detailed_itinerary:
-                    print("行程规划：\n")
-                    for day, events in detailed_itinerary.items():
-                        print(f"\n{day}:")
-                        for e in events:
-                            title = e.get("title", "")
-                            detail = e.get("detail", "")
-                            print(f" - {title}: {detail}")
-                else:
-                    print("未检测到行程文本，请确认 generate_itinerary() 返回结构。")
-
-        # ---------------- 推荐类任务 ----------------
-        elif task_type == "recommendation":
-            rec = response.get("recommendations", {})
-            summary_text = (
-                rec.get("natural_summary") or rec.get("summary") or "（未生成推荐摘要）"
-            )
-            print("推荐摘要：\n")
-            print(summary_text)
 
-        # ---------------- 其他情况 ----------------
+def render_response(response: dict) -> str:
+    """
+    把一轮的 NLU 结果渲染为给用户看的文本 (命令行交互使用)
+
+    需要补充信息时返回追问, 行程类返回 Markdown 行程, 推荐类返回推荐摘要, 其他情况返回 JSON.
+    """
+    if response.get("need_more_info"):
+        follow_up = response.get("follow_up", "我还需要一些补充信息～")
+        return f"🤔 需要补充信息：\n\n{follow_up}\n\n****************************************"
+
+    task_type = (response.get("intent_parsed") or {}).get("task_type", "")
+    lines: list[str] = []
+
+    # ---------------- 行程类任务 ----------------
+    if task_type == "itinerary":
+        di = response.get("detailed_itinerary") or {}
+        md = response.get("itinerary_markdown") or di.get("itinerary_markdown")
+        if md:
+            lines.append("行程规划：\n")
+            lines.append(md.strip())
         else:
-            print(json.dumps(response, ensure_ascii=False, indent=2))
+            # 兜底：如果没生成文，就退回到 detail 提取版
+            detailed_itinerary = di.get("itinerary", {})
+            if detailed_itinerary:
+                lines.append("行程规划：\n")
+                for day, events in detailed_itinerary.items():
+                    lines.append(f"\n{day}:")
+                    for e in events:
+                        title = e.get("title", "")
+                        detail = e.get("detail", "")
+                        lines.append(f" - {title}: {detail}")
+            else:
+                lines.append("未检测到行程文本，请确认 generate_itinerary() 返回结构。")
 
-        print("\n****************************************")
+    # ---------------- 推荐类任务 ----------------
+    elif task_type == "recommendation":
+        rec = response.get("recommendations") or {}
+        summary_text = (
+            rec.get("natural_summary") or rec.get("summary") or "（未生成推荐摘要）"
+        )
+        lines.append("推荐摘要：\n")
+        lines.append(summary_text)
 
-        return response
+    # ---------------- 其他情况 ----------------
+    else:
+        lines.append(
+            orjson.dumps(
+                response, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            ).decode()
+        )
+
+    lines.append("\n****************************************")
+    return "\n".join(lines)
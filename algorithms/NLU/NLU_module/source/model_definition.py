@@ -1,4 +1,19 @@
-from openai import AsyncAzureOpenAI
+import asyncio
+import time
+
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 
 subscription_key = "4hKGTBkNnI6L99CIYrkaTkLG3l5B5TrxeemojpEwEWE0WUaIKWVYJQQJ99BCACYeBjFXJ3w3AAABACOGtb7r"
 endpoint = "https://newsource.openai.azure.com/"
@@ -14,3 +29,40 @@ gpt_client = AsyncAzureOpenAI(
 )
 
 GPT_MODEL_NAME = deployment
+
+# 可重试的瞬时错误: 429 限流, 超时, 连接失败, 5xx
+TRANSIENT_LLM_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+)
+
+# 最近一次 429 之后的冷却截止时间 (monotonic), 冷却期内新请求先等待, 不发注定失败的调用
+_rate_limit_until = 0.0
+
+
+def _note_rate_limit(retry_state):
+    """tenacity before_sleep 钩子: 遇到 429 时把冷却期延长到本次退避结束"""
+    global _rate_limit_until
+    if isinstance(retry_state.outcome.exception(), RateLimitError):
+        _rate_limit_until = max(
+            _rate_limit_until, time.monotonic() + retry_state.next_action.sleep
+        )
+
+
+async def wait_rate_limit_cooldown():
+    """处于 429 冷却期时等待冷却结束"""
+    delay = _rate_limit_until - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+# Adviser / Verifier 共用的 LLM 调用重试策略: 指数退避 + 抖动
+llm_retry = retry(
+    retry=retry_if_exception_type(TRANSIENT_LLM_ERRORS),
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    stop=stop_after_attempt(5),
+    before_sleep=_note_rate_limit,
+    reraise=True,
+)
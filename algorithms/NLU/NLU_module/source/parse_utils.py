@@ -1,29 +1,179 @@
 # -*- coding: utf-8 -*-
 import re
+import string
+from typing import Any
+
+import orjson
+
+# JSON 结构字符 (单字符类, 线性匹配无回溯); 扫描时只在这些位置做 Python 级判断
+_JSON_STRUCTURAL_RE = re.compile(r'[{}\["\\]')
+
+
+class JsonObjectScanner:
+    """
+    增量扫描文本, 定位第一个括号平衡的 JSON 对象 (忽略字符串字面量中的括号)
+
+    可逐段 feed (例如流式 LLM 输出), 整体只做一次线性扫描: 预编译的正则在 C 层
+    跳过普通字符, 只有结构字符才进入 Python 分支.
+    若第一个结构字符是 "[", 说明顶层是数组, 不再追踪对象边界.
+    """
+
+    def __init__(self):
+        self.start = -1  # 对象起始下标 ("{" 的位置)
+        self.end = -1  # 对象结束下标 (不含)
+        self.disabled = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped_at = -1  # 被反斜杠转义的字符下标
+
+    @property
+    def complete(self) -> bool:
+        return self.end >= 0
+
+    def feed(self, chunk: str) -> bool:
+        """扫描新的一段文本, 返回对象是否已完整"""
+        if self.complete or self.disabled:
+            self._pos += len(chunk)
+            return self.complete
+
+        for match in _JSON_STRUCTURAL_RE.finditer(chunk):
+            index = self._pos + match.start()
+            ch = match.group()
+            if self._in_string:
+                if index == self._escaped_at:
+                    continue
+                if ch == "\\":
+                    self._escaped_at = index + 1
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == "{":
+                if self.start < 0:
+                    self.start = index
+                self._depth += 1
+            elif self.start < 0:
+                if ch == "[":
+                    self.disabled = True
+                    break
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = index + 1
+                    break
+
+        self._pos += len(chunk)
+        return self.complete
+
+
+def _find_json_object(text: str) -> str | None:
+    """返回文本中第一个完整 JSON 对象对应的子串, 找不到时返回 None"""
+    start = text.find("{")
+    if start < 0:
+        return None
+    scanner = JsonObjectScanner()
+    if scanner.feed(text[start:]):
+        return text[start : start + scanner.end]
+    return None
+
+
+def parse_llm_json(text: str) -> Any:
+    """
+    解析 LLM 返回的 JSON 文本
+
+    先整体解析; 失败则提取文本中第一个完整的 JSON 对象再解析;
+    仍失败时返回 {"raw_text": text}.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+
+    candidate = _find_json_object(text)
+    if candidate is not None:
+        try:
+            return orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            pass
+    return {"raw_text": text}
+
+
+# parse_correct_answer 的关键字忽略大小写匹配; 小写文本须与原文下标一致, 必要时只转换 A-Z
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_LEADING_DASHES = "-–—"
+
+
+def _iter_key_values(text: str, low: str, key: str):
+    """依次返回每个 "key<空白>:<空白>" 之后的位置 (key 在 low 中查找)"""
+    n = len(text)
+    pos = low.find(key)
+    while pos != -1:
+        j = pos + len(key)
+        while j < n and text[j].isspace():
+            j += 1
+        if j < n and text[j] == ":":
+            j += 1
+            while j < n and text[j].isspace():
+                j += 1
+            yield j
+        pos = low.find(key, pos + 1)
+
+
+def _strip_rule_lines(text: str) -> str:
+    """删除所有 "换行 + ---" 开头的行 (连同前面的换行), 等价于 re.sub(r"[\n\r]+---.*", "", text)"""
+    parts = []
+    start = 0  # 尚未输出部分的起点
+    pos = text.find("---")
+    while pos != -1:
+        run = pos
+        while run > start and text[run - 1] in "\r\n":
+            run -= 1
+        if run == pos:
+            pos = text.find("---", pos + 1)
+            continue
+        end = text.find("\n", pos + 3)
+        if end == -1:
+            end = len(text)
+        parts.append(text[start:run])
+        start = end
+        pos = text.find("---", end)
+    parts.append(text[start:])
+    return "".join(parts)
 
 
 def parse_correct_answer(yaml_text: str):
+    """
+    解析 Verifier 的 YAML 风格输出, 返回 (explanation, is_safe)
+
+    用 str.find 在 C 层定位关键字, 不经过正则引擎.
+    """
     if not yaml_text:
         return "Empty response.", True
 
+    low = yaml_text.lower()
+    if len(low) != len(yaml_text):  # 少数字符 (如 "İ") 小写后长度会变, 退回只转换 ASCII
+        low = yaml_text.translate(_ASCII_LOWER)
+
     # 提取 response_is_safe（True/False）
-    match_safe = re.search(
-        r"response_is_safe\s*:\s*(True|False)", yaml_text, re.IGNORECASE
-    )
     is_safe = True  # 默认安全
-    if match_safe:
-        is_safe = match_safe.group(1).strip().lower() == "true"
+    for j in _iter_key_values(yaml_text, low, "response_is_safe"):
+        if low.startswith("true", j):
+            break
+        if low.startswith("false", j):
+            is_safe = False
+            break
 
     # 提取 explanation（多行兼容）
-    match_exp = re.search(
-        r"explanation\s*:\s*(.*)", yaml_text, re.IGNORECASE | re.DOTALL
-    )
     explanation = "No explanation found."
-    if match_exp:
+    for j in _iter_key_values(yaml_text, low, "explanation"):
         # 去掉多余换行与分隔符
-        explanation = match_exp.group(1).strip()
-        explanation = re.sub(r"^[-–—]+\s*", "", explanation)
-        explanation = re.sub(r"[\n\r]+---.*", "", explanation)  # 删除尾部的 "---"
+        explanation = yaml_text[j:].strip()
+        stripped = explanation.lstrip(_LEADING_DASHES)
+        if len(stripped) != len(explanation):
+            explanation = stripped.lstrip()
+        explanation = _strip_rule_lines(explanation)  # 删除尾部的 "---"
         explanation = explanation.strip()
+        break
 
     return explanation, is_safe
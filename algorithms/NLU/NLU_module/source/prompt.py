@@ -88,6 +88,7 @@ def prompt_parse_intent(
     if previous_task_type:
         task_type_instruction = f'\n⚠️ 重要提示：历史对话中的任务类型是 "{previous_task_type}"，当前输入应该继承这个任务类型（除非用户明确改变任务类型）。'
 
+    # 静态的规则和输出示例在前, 历史对话和当前输入在后, 让不同请求共享尽可能长的 prompt 前缀 (服务端前缀缓存)
     return f"""
 你是一名智能旅行规划助手。
 请阅读以下用户输入，判断任务类型并提取完整的旅行意图槽位，以 JSON 格式输出。
@@ -111,8 +112,6 @@ def prompt_parse_intent(
    - 当用户当前输入未涉及目的地变更或只是补充其他信息（如预算、天数等）时，输出 "keep"
    - 如果无法明确判断，默认使用 "append"
 7) 只返回 JSON。
-{history_context}{task_type_instruction}
-当前用户输入: "{user_input}"
 
 输出示例（仅作格式参考）:
 {{
@@ -129,6 +128,8 @@ def prompt_parse_intent(
   "missing_slots": ["date_window", "budget_total_cny"],
   "confidence": 0.9
 }}
+{history_context}{task_type_instruction}
+当前用户输入: "{user_input}"
 
 请只返回 JSON 格式输出。
     """
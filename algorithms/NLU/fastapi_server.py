@@ -1,30 +1,92 @@
 import asyncio
-import json
+import functools
+import importlib.util
 import logging
+import logging.handlers
 import os
-import sys
-from collections import OrderedDict
-from collections.abc import AsyncGenerator
+import queue
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from contextlib import aclosing
+from operator import itemgetter
 from typing import Any, Dict, Optional
 from uuid import uuid4
 
-from fastapi import FastAPI, HTTPException
+import orjson
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from NLU_module.main import NLU
-from pydantic import BaseModel
+from NLU_module.agents.adviser.adviser_aggregate import run_aggregate
+from NLU_module.agents.adviser.adviser_context import run_context_summary
+from NLU_module.agents.adviser.adviser_intent import run_intent_parsing
+from NLU_module.agents.adviser.adviser_itinerary import generate_itinerary_stream
+from NLU_module.agents.adviser.adviser_main import CITY_MAP, merge_partial
+from NLU_module.agents.adviser.adviser_plan_actions import run_plan_actions
+from NLU_module.agents.adviser.adviser_rag import call_rag_api_cached, close_rag_client
+from NLU_module.agents.adviser.adviser_recommendation import (
+    generate_recommendations_stream,
+)
+from NLU_module.main import NLU, NLUEngine, NLUSession
+from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
-# 内存会话缓存 (使用 OrderedDict 实现 LRU)
-SESSIONS: OrderedDict[str, NLU] = OrderedDict()
 
-# 会话管理配置
-MAX_SESSIONS = 100  # 最大会话数, 超过后淘汰最旧的会话
+def _start_log_listener() -> logging.handlers.QueueListener:
+    """
+    NLU 日志经 QueueHandler 交给后台 QueueListener 线程输出, 请求路径上不直接写 stdout/stderr
+
+    级别由 NLU_LOG_LEVEL 控制 (默认 INFO); 设置 NLU_LOG_FILE 时写入该文件, 否则写 stderr.
+    只接管 NLU_module 和本模块的 logger, 不改动 root logger (避免打开 httpx 等第三方库的 INFO 日志).
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    log_file = os.getenv("NLU_LOG_FILE")
+    handler = (
+        logging.FileHandler(log_file, encoding="utf-8")
+        if log_file
+        else logging.StreamHandler()
+    )
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    level = os.getenv("NLU_LOG_LEVEL", "INFO").upper()
+    for name in ("NLU_module", logger.name):
+        nlu_logger = logging.getLogger(name)
+        nlu_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        nlu_logger.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+_log_listener = _start_log_listener()
+
+# 内存会话缓存 (使用 OrderedDict 实现 LRU); 只保存轻量的会话状态, Adviser / Verifier 由 engine 共享
+SESSIONS: OrderedDict[str, NLUSession] = OrderedDict()
+# 创建 / 淘汰会话时持有, 保证容量检查和淘汰之间不会被其他协程插入
+_SESSIONS_LOCK = asyncio.Lock()
+
+# 会话管理配置: 会话只是轻量状态 (引擎共享), 上限可以放宽; 超过上限淘汰最久未用的会话,
+# 超过 SESSION_TTL 秒未访问的会话在下次取会话时清理
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1024"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
 
 # 请求超时时间 (秒), 留 2s buffer 给 backend 的 60s 超时
 REQUEST_TIMEOUT = 58.0
 
+# 推理工作队列: 接口只负责把 (会话, 输入, future) 放入有界队列, 由固定数量的 worker 执行 engine.run;
+# 同时处理的轮次不超过 NLU_WORKERS, 队列满时直接返回 503, 而不是让协程无限堆积
+NLU_WORKERS = int(os.getenv("NLU_WORKERS", "8"))
+NLU_QUEUE_SIZE = int(os.getenv("NLU_QUEUE_SIZE", "64"))
+_work_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+# 有轮次在排队或执行中的会话 -> 该会话后续等待的轮次; 保证同一会话同时只有一轮进入工作队列,
+# 否则同一会话的多轮会各占一个 worker 并阻塞在会话锁上, 拖住其他会话
+_session_turns: dict[NLUSession, deque] = {}
+# 已从 SESSIONS 删除但仍有轮次未处理完的会话, 由处理完最后一轮的 worker 关闭
+_closing_sessions: set[NLUSession] = set()
+
 app = FastAPI(title="YATA NLU API", description="智能旅行助手", version="1.0.0")
 
 # 开启 CORS 支持
@@ -36,12 +98,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-try:
-    nlu = NLU(with_verifier=True)
-    print("NLU 模块初始化成功 (Adviser + Verifier 已就绪)")
-except Exception as e:
-    print(f"初始化 NLU 失败: {e}", file=sys.stderr)
-    nlu = None
+# 共享的 NLU 引擎与 /nlu 使用的全局会话, 在 startup 时于线程池中构造
+engine: NLUEngine | None = None
+nlu: NLU | None = None
+
+
+def _init_nlu():
+    """构造 NLU 引擎 (本地模型模式下会加载权重, 耗时较长, 在线程池中执行)"""
+    global engine, nlu
+    try:
+        engine = NLUEngine(with_verifier=True)
+        nlu = NLU(engine=engine)
+        logger.info("NLU 模块初始化成功 (Adviser + Verifier 已就绪)")
+    except Exception as e:
+        logger.error("初始化 NLU 失败: %s", e)
+        engine = None
+        nlu = None
 
 
 class NLURequest(BaseModel):
@@ -55,38 +127,127 @@ class NLUResponse(BaseModel):
     error: Optional[str] = None
 
 
+class SessionLimitRequest(BaseModel):
+    max_sessions: int = Field(ge=1)
+
+
 @app.on_event("startup")
 async def startup_event():
-    print("YATA NLU API 服务已启动。")
+    global _work_queue
+    await asyncio.get_running_loop().run_in_executor(None, _init_nlu)
+    _work_queue = asyncio.Queue(maxsize=NLU_QUEUE_SIZE)
+    _workers.extend(
+        asyncio.create_task(_worker_loop(_work_queue), name=f"nlu-worker-{i}")
+        for i in range(NLU_WORKERS)
+    )
+    logger.info("YATA NLU API 服务已启动。")
 
 
-def _get_or_create_session(session_id: str) -> NLU:
+@app.on_event("shutdown")
+async def shutdown_event():
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    await close_rag_client()
+    # 关闭各会话的日志文件句柄 (排队中的日志会先写完)
+    for session in SESSIONS.values():
+        session.close()
+    SESSIONS.clear()
+    if nlu:
+        nlu.close()
+    _log_listener.stop()
+
+
+def _session_busy(session: NLUSession) -> bool:
+    """会话有轮次在排队或执行中 (不能关闭)"""
+    return session.lock.locked() or session in _session_turns
+
+
+def _evict_expired_sessions(now: float):
+    """
+    清理超过 SESSION_TTL 未访问的会话
+
+    SESSIONS 按最近访问排序, 从最旧的一端扫描, 遇到未过期的即可停止;
+    有轮次在排队或执行中的会话不会被清理.
+    """
+    while SESSIONS:
+        sid, session = next(iter(SESSIONS.items()))
+        if now - session.last_active <= SESSION_TTL or _session_busy(session):
+            break
+        del SESSIONS[sid]
+        session.close()  # 关闭日志文件句柄并丢弃历史
+        logger.info("⌛ 会话过期清理: %s (当前会话数: %d)", sid, len(SESSIONS))
+
+
+def _evict_lru_sessions(limit: int):
     """
-    获取或创建会话 (实现 LRU 淘汰策略)
+    淘汰最久未用的会话, 直到会话数不超过 limit (调用方需持有 _SESSIONS_LOCK)
+
+    有轮次在排队或执行中的会话会被跳过, 此时会话数可能暂时超过上限.
+    """
+    excess = len(SESSIONS) - limit
+    if excess <= 0:
+        return
+    victims = []
+    for sid, session in SESSIONS.items():  # 从最旧的一端开始
+        if len(victims) >= excess:
+            break
+        if not _session_busy(session):
+            victims.append(sid)
+    for sid in victims:
+        SESSIONS.pop(sid).close()  # 关闭日志文件句柄并丢弃历史
+        logger.info("🗑️  淘汰最旧会话 (LRU): %s (当前会话数: %d)", sid, len(SESSIONS))
+
+
+async def _get_or_create_session(session_id: str) -> NLUSession:
+    """
+    获取或创建会话 (实现 LRU + TTL 淘汰策略)
+
+    命中时不加锁直接返回; 创建和淘汰在 _SESSIONS_LOCK 内进行,
+    同一 session_id 的并发请求只会创建一个会话.
 
     Args:
         session_id: 会话 ID (backend 的 thread_id)
 
     Returns:
-        NLU 实例
+        会话状态 (NLUSession)
     """
+    now = time.monotonic()
+
     # 如果会话已存在, 移到末尾 (最近使用)
-    if session_id in SESSIONS:
+    if (session := SESSIONS.get(session_id)) is not None:
         SESSIONS.move_to_end(session_id)
-        print(f"♻️  复用现有会话: {session_id}")
-        return SESSIONS[session_id]
-
-    # 如果达到最大会话数, 淘汰最旧的会话 (LRU)
-    if len(SESSIONS) >= MAX_SESSIONS:
-        oldest_sid, oldest_nlu = SESSIONS.popitem(last=False)
-        print(f"🗑️  淘汰最旧会话 (LRU): {oldest_sid} (当前会话数: {len(SESSIONS)})")
-        del oldest_nlu  # 释放内存
-
-    # 创建新会话
-    new_nlu = NLU(log_folder="log", file_name=session_id, with_verifier=True)
-    SESSIONS[session_id] = new_nlu
-    print(f"✨ 创建新会话: {session_id} (当前会话数: {len(SESSIONS)})")
-    return new_nlu
+        session.last_active = now
+        logger.debug("♻️  复用现有会话: %s", session_id)
+        return session
+
+    async with _SESSIONS_LOCK:
+        # 等锁期间可能已被其他请求创建
+        if (session := SESSIONS.get(session_id)) is not None:
+            session.last_active = now
+            return session
+
+        _evict_expired_sessions(now)
+        # 为新会话腾出位置 (LRU)
+        _evict_lru_sessions(MAX_SESSIONS - 1)
+
+        # 创建新会话 (建目录 / 打开日志文件, 放到线程池中执行, 不阻塞事件循环)
+        session = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(NLUSession, log_folder="log", file_name=session_id),
+        )
+        SESSIONS[session_id] = session
+        logger.info("✨ 创建新会话: %s (当前会话数: %d)", session_id, len(SESSIONS))
+        return session
+
+
+async def resize_sessions(max_sessions: int):
+    """运行时调整会话上限, 超出的空闲会话按 LRU 立即淘汰 (正在处理的会话跳过)"""
+    global MAX_SESSIONS
+    async with _SESSIONS_LOCK:
+        MAX_SESSIONS = max(1, max_sessions)
+        _evict_lru_sessions(MAX_SESSIONS)
 
 
 def _delete_session(session_id: str) -> bool:
@@ -98,17 +259,185 @@ def _delete_session(session_id: str) -> bool:
 
     Returns:
         是否成功删除
+
+    会话仍有轮次在排队或执行中时, 先从 SESSIONS 移除 (不再接收新的轮次),
+    等最后一轮处理完后再关闭.
     """
-    if session_id in SESSIONS:
-        nlu_instance = SESSIONS.pop(session_id)
-        del nlu_instance
-        print(f"🗑️  主动删除会话: {session_id} (剩余会话数: {len(SESSIONS)})")
-        return True
-    return False
+    if (session := SESSIONS.pop(session_id, None)) is None:
+        return False
+    if _session_busy(session):
+        _closing_sessions.add(session)
+    else:
+        session.close()
+    logger.info("🗑️  主动删除会话: %s (剩余会话数: %d)", session_id, len(SESSIONS))
+    return True
+
+
+async def _worker_loop(work_queue: asyncio.Queue):
+    """
+    推理 worker: 从队列取出一轮 (通常是 engine.run), 执行后把结果写回 future
+
+    同一会话同时只有一轮在队列中或执行中, 后续轮次挂在 _session_turns 上,
+    由执行完上一轮的 worker 接着处理; worker 不会阻塞在会话锁上.
+    调用方超时或取消时 future 被取消, 同时取消正在执行的这一轮.
+    """
+    while True:
+        item = await work_queue.get()
+        session = item[0]
+        try:
+            while item is not None:
+                await _process_turn(*item)
+                item = _next_session_turn(session)
+        except asyncio.CancelledError:
+            # worker 被取消 (服务关闭): 该会话排队中的轮次不会再执行
+            for _, _, fut, _ in _session_turns.get(session, ()):
+                fut.cancel()
+            _release_session(session)
+            raise
+
+
+def _next_session_turn(session: NLUSession) -> tuple | None:
+    """取出该会话排队中的下一轮 (跳过调用方已放弃的); 没有时解除会话的占用标记"""
+    pending = _session_turns.get(session)
+    while pending:
+        item = pending.popleft()
+        if not item[2].done():
+            return item
+    _release_session(session)
+    return None
+
+
+def _release_session(session: NLUSession):
+    """会话的轮次全部处理完: 解除占用标记, 已被删除的会话在此关闭"""
+    _session_turns.pop(session, None)
+    if session in _closing_sessions:
+        _closing_sessions.discard(session)
+        session.close()
+
+
+async def _process_turn(
+    session: NLUSession,
+    turn: Callable[[], Awaitable[dict]],
+    fut: asyncio.Future,
+    http_request: Request | None,
+):
+    # 排队期间已超时 / 被取消, 或客户端已断开的请求直接丢弃, 不再占用 LLM 调用
+    if fut.done():
+        return
+    if http_request is not None and await http_request.is_disconnected():
+        fut.cancel()
+        logger.info("客户端已断开, 丢弃排队中的请求")
+        return
+    run_task = asyncio.create_task(_run_locked(session, turn))
+    fut.add_done_callback(functools.partial(_cancel_if_abandoned, run_task))
+    try:
+        result = await run_task
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            run_task.cancel()
+            raise
+        return  # 调用方已放弃, 取消的是本轮任务, worker 继续
+    except Exception as e:
+        if not fut.done():
+            fut.set_exception(e)
+    else:
+        if not fut.done():
+            fut.set_result(result)
+
+
+def _cancel_if_abandoned(run_task: asyncio.Task, fut: asyncio.Future):
+    if fut.cancelled():
+        run_task.cancel()
+
+
+async def _run_locked(session: NLUSession, turn: Callable[[], Awaitable[dict]]):
+    # 同一会话的轮次已由 _session_turns 串行化, 这里的锁不会有竞争, 只用来标记会话正在处理
+    async with session.lock:
+        return await turn()
+
+
+async def _run_turn(
+    session: NLUSession, text: str, http_request: Request | None = None
+) -> dict:
+    """
+    把一轮输入交给推理 worker 并等待结果; 队列满返回 503, 超时返回 504
+
+    传入 http_request 时, worker 开始处理前会检查客户端是否已断开.
+    """
+    return await _submit_turn(
+        session, functools.partial(engine.run, session, text), http_request
+    )
+
+
+async def _submit_turn(
+    session: NLUSession,
+    turn: Callable[[], Awaitable[dict]],
+    http_request: Request | None = None,
+) -> dict:
+    """
+    把一轮 (读写会话状态的协程函数) 排进该会话的轮次链并等待结果
+
+    同一会话的轮次 (/nlu, /nlu/simple 的 engine.run 和流式接口的意图解析) 依次执行, 互不交错.
+    """
+    fut = asyncio.get_running_loop().create_future()
+    item = (session, turn, fut, http_request)
+    if (pending := _session_turns.get(session)) is not None:
+        # 该会话已有一轮在排队或执行, 排在其后, 由处理完上一轮的 worker 接着执行
+        if len(pending) >= NLU_QUEUE_SIZE:
+            raise HTTPException(status_code=503, detail="NLU 服务繁忙, 请稍后重试")
+        pending.append(item)
+    else:
+        try:
+            _work_queue.put_nowait(item)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="NLU 服务繁忙, 请稍后重试")
+        _session_turns[session] = deque()
+    try:
+        async with asyncio.timeout(REQUEST_TIMEOUT):
+            return await fut
+    except TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"NLU 处理超时 (>{REQUEST_TIMEOUT}s), 请稍后重试或简化请求",
+        )
+
+
+def _postprocess(result: dict) -> tuple[str, str, str]:
+    """
+    从 NLU 结果中提取给前端的自然语言回复
+
+    Returns:
+        (task_type, reply, status), status 为 "complete" 或 "incomplete"
+    """
+    task_type = (result.get("intent_parsed") or {}).get("task_type", "unknown")
+    di = result.get("detailed_itinerary") or {}
+    rec = result.get("recommendations") or {}
+
+    itinerary_md = result.get("itinerary_markdown") or di.get("itinerary_markdown")
+    recommend_md = rec.get("natural_summary") or rec.get("summary")
+    general_text = result.get("final_summary") or result.get("text_output")
+
+    if reply := itinerary_md or recommend_md or general_text:
+        return task_type, reply, "complete"
+
+    if "follow_up" in result:
+        return task_type, result["follow_up"], "incomplete"
+
+    if "clarification" in result:
+        clar = result["clarification"]
+        qs = clar.get("questions", [])
+        sug = clar.get("suggestions", [])
+        parts = ["我还需要一些信息："]
+        parts.extend(f"· {q}" for q in qs)
+        if sug:
+            parts.append("示例：" + "；".join(sug))
+        return task_type, "\n".join(parts), "incomplete"
+
+    return task_type, "暂无自然语言输出，请检查 Adviser 模块。", "complete"
 
 
 @app.post("/nlu", response_model=NLUResponse)
-async def nlu_api(request: NLURequest):
+async def nlu_api(request: NLURequest, http_request: Request):
     if not nlu:
         raise HTTPException(status_code=500, detail="NLU 模块未初始化")
 
@@ -116,18 +445,9 @@ async def nlu_api(request: NLURequest):
         if not request.text or not request.text.strip():
             raise HTTPException(status_code=400, detail="输入内容不能为空")
 
-        print(f"收到输入: {request.text}")
-
-        # 添加超时保护
-        try:
-            async with asyncio.timeout(REQUEST_TIMEOUT):
-                result = await nlu.run(request.text)
-        except TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail=f"NLU 处理超时 (>{REQUEST_TIMEOUT}s), 请稍后重试或简化请求",
-            )
+        logger.info("收到输入: %s", request.text)
 
+        result = await _run_turn(nlu.session, request.text, http_request)
         if result is None:
             raise HTTPException(status_code=500, detail="Adviser 未返回结果")
 
@@ -136,12 +456,12 @@ async def nlu_api(request: NLURequest):
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"[NLU ERROR]: {e}", file=sys.stderr)
+        logger.exception("[NLU ERROR]: %s", e)
         return NLUResponse(success=False, error=str(e))
 
 
 @app.post("/nlu/simple")
-async def nlu_simple_api(request: NLURequest):
+async def nlu_simple_api(request: NLURequest, http_request: Request):
     if not nlu:
         raise HTTPException(status_code=500, detail="NLU 模块未初始化")
 
@@ -150,74 +470,154 @@ async def nlu_simple_api(request: NLURequest):
     sid = request.session_id or str(uuid4())
 
     # 获取或创建会话 (自动实现 LRU 淘汰)
-    session_nlu = _get_or_create_session(sid)
+    session = await _get_or_create_session(sid)
 
     try:
-        print(f"[Session {sid}] 输入: {request.text}")
-
-        # 添加超时保护
-        try:
-            async with asyncio.timeout(REQUEST_TIMEOUT):
-                result = await session_nlu.run(request.text)
-        except TimeoutError:
-            raise HTTPException(
-                status_code=504,
-                detail=f"NLU 处理超时 (>{REQUEST_TIMEOUT}s), 请稍后重试或简化请求",
-            )
+        logger.info("[Session %s] 输入: %s", sid, request.text)
 
+        result = await _run_turn(session, request.text, http_request)
         if not result:
             raise HTTPException(status_code=500, detail="Adviser 无输出")
 
-        task_type = result.get("intent_parsed", {}).get("task_type", "unknown")
+        task_type, reply, status = _postprocess(result)
+        return {
+            "session_id": sid,
+            "type": task_type,
+            "status": status,
+            "reply": reply,
+        }
 
-        itinerary_md = result.get("itinerary_markdown") or result.get(
-            "detailed_itinerary", {}
-        ).get("itinerary_markdown")
+    except HTTPException:
+        # 超时 (504) 等已确定状态码的错误原样返回, 不再包装成 500
+        raise
+    except Exception as e:
+        logger.exception("[NLU SIMPLE ERROR]: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        recommend_md = result.get("recommendations", {}).get(
-            "natural_summary"
-        ) or result.get("recommendations", {}).get("summary")
 
-        general_text = result.get("final_summary") or result.get("text_output")
+def _sse_event(data: dict) -> bytes:
+    """生成 SSE 事件 (直接构造 UTF-8 bytes, StreamingResponse 不再逐帧编码)"""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
 
-        has_content = bool(itinerary_md or recommend_md or general_text)
 
-        if has_content:
-            reply = itinerary_md or recommend_md or general_text
-            status = "complete"
+# 内容固定的 SSE 帧在导入时预先编码
+_SSE_DONE = b"data: [DONE]\n\n"
+_STREAM_PHASES = (
+    "intent_parsing",
+    "rag_search",
+    "content_generation",
+    "itinerary_generation",
+    "recommendation_generation",
+)
+_SSE_PHASE_START = {
+    phase: _sse_event({"type": "phase_start", "phase": phase})
+    for phase in _STREAM_PHASES
+}
+_SSE_PHASE_END = {
+    phase: _sse_event({"type": "phase_end", "phase": phase}) for phase in _STREAM_PHASES
+}
 
-        elif "follow_up" in result:
-            reply = result["follow_up"]
-            status = "incomplete"
 
-        elif "clarification" in result:
-            clar = result["clarification"]
-            qs = clar.get("questions", [])
-            sug = clar.get("suggestions", [])
-            reply = "我还需要一些信息：\n" + "\n".join([f"· {q}" for q in qs])
-            if sug:
-                reply += "\n示例：" + "；".join(sug)
-            status = "incomplete"
+@functools.lru_cache(maxsize=1024)
+def build_query_text(task_type: str, city: str) -> str:
+    """流式接口的 RAG 查询文本, 只取决于 (task_type, city)"""
+    if task_type == "itinerary":
+        return f"{city} attractions restaurants hotels travel guide"
+    return f"{city} recommendations"
 
-        else:
-            reply = "暂无自然语言输出，请检查 Adviser 模块。"
-            status = "complete"
 
-        return {
-            "session_id": sid,
-            "type": task_type,
-            "status": status,
-            "reply": reply,
-        }
+# 构造 context_summary 所需的文档摘要时按 (title, content) 取值
+_title_content = itemgetter("title", "content")
+
+# 流式生成时 LLM token 与 SSE 发送之间的有界缓冲: 客户端消费慢时队列写满, 生产者随之阻塞,
+# 每个流最多缓存 STREAM_QUEUE_SIZE 个 token
+STREAM_QUEUE_SIZE = int(os.getenv("NLU_STREAM_QUEUE_SIZE", "256"))
+# 逐 token 发帧开销大: 窗口 (毫秒) 内到达的 token 合并为一个 SSE 帧, 单帧累计超过上限字符数时立即发送
+STREAM_COALESCE_MS = float(os.getenv("NLU_STREAM_COALESCE_MS", "30"))
+STREAM_FRAME_MAX_CHARS = 512
+_STREAM_END = object()
+
 
+async def _pump_tokens(token_stream: AsyncIterator[str], out_q: asyncio.Queue):
+    """生产者: 把 token 流搬进有界队列, 结束时放入 _STREAM_END, 出错时放入异常交给消费者抛出"""
+    try:
+        async for token in token_stream:
+            await out_q.put(token)
     except Exception as e:
-        print(f"[NLU SIMPLE ERROR]: {e}", file=sys.stderr)
-        raise HTTPException(status_code=500, detail=str(e))
+        await out_q.put(e)
+    else:
+        await out_q.put(_STREAM_END)
+
 
+async def _bounded_tokens(
+    token_stream: AsyncIterator[str],
+) -> AsyncGenerator[str, None]:
+    """
+    通过有界队列消费 token 流 (生产者在后台任务中运行), 并把相邻 token 合并成较大的片段
+
+    SSE 发送被慢客户端拖住时, 生产者最多领先 STREAM_QUEUE_SIZE 个 token 后在 put 上阻塞;
+    消费结束或被中途关闭时取消生产者. 拼接后的文本与逐 token 输出完全一致.
+    token 流只在这里合并一次; 第一个片段立即发出, 之后的片段才等待攒批窗口.
+    """
+    window = STREAM_COALESCE_MS / 1000
+    out_q: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    producer = asyncio.create_task(_pump_tokens(token_stream, out_q))
+    try:
+        first = True
+        finished = False
+        while not finished:
+            item = await out_q.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            # 队列里暂时没有后续 token 时等一个窗口, 让生产者攒批 (首个片段不等, 保证首字延迟)
+            if window > 0 and not first and out_q.empty():
+                await asyncio.sleep(window)
+            first = False
+            buf = [item]
+            size = len(item)
+            error = None
+            while size < STREAM_FRAME_MAX_CHARS and not out_q.empty():
+                item = out_q.get_nowait()
+                if item is _STREAM_END:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    error = item
+                    break
+                buf.append(item)
+                size += len(item)
+            # 出错前已生成的内容照常发出
+            yield "".join(buf)
+            if error is not None:
+                raise error
+    finally:
+        producer.cancel()
+
+
+async def _stream_parse_intent(session: NLUSession, text: str) -> dict:
+    """
+    流式接口的意图解析: 解析本轮意图并与会话记忆合并
 
-def _sse_event(data: dict) -> str:
-    """生成 SSE 事件字符串"""
-    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    识别出目的地时把合并后的意图写回 session.memory 并放入 result["intent_parsed"];
+    否则不修改会话记忆, 由调用方追问.
+    """
+    result = (
+        await run_intent_parsing(
+            engine.adviser.llm,
+            text,
+            session.memory.get("history", []),
+            debug=True,
+        )
+        or {}
+    )
+    intent_cur = result.get("intent_parsed", {})
+    if intent_cur.get("dest_pref"):
+        # 合并历史上下文
+        session.memory = merge_partial(session.memory, intent_cur)
+        result["intent_parsed"] = session.memory
+    return result
 
 
 @app.post("/nlu/simple/stream")
@@ -238,44 +638,25 @@ async def nlu_simple_stream(request: NLURequest):
     # 使用 session_id（后端传过来的 thread_id）
     sid = request.session_id or str(uuid4())
 
-    async def generate_events() -> AsyncGenerator[str, None]:
+    async def generate_events() -> AsyncGenerator[bytes, None]:
         """生成 SSE 事件流"""
         # 获取或创建会话
-        session_nlu = _get_or_create_session(sid)
+        session = await _get_or_create_session(sid)
+        # 提前启动的后台任务; RAG 失败或客户端中途断开时在 finally 中取消, 不留孤儿任务
+        pending: list[asyncio.Task] = []
 
         try:
-            logger.info(f"[Stream {sid}] 开始处理: {request.text[:50]}...")
+            logger.info("[Stream %s] 开始处理: %.50s...", sid, request.text)
 
             # === 阶段 1: Intent Parsing ===
-            yield _sse_event({"type": "phase_start", "phase": "intent_parsing"})
+            yield _SSE_PHASE_START["intent_parsing"]
 
-            # 执行意图识别 (使用 session_nlu.adviser.generate_response 的部分逻辑)
-            # 这里我们复用原有的串行逻辑，只在最后的行程生成部分使用流式
-            from NLU_module.agents.adviser.adviser_intent import run_intent_parsing
-            from NLU_module.agents.adviser.adviser_itinerary import (
-                generate_itinerary_stream,
+            # 执行意图识别 (使用 engine.adviser.generate_response 的部分逻辑)
+            # 这里我们复用原有的串行逻辑，只在最后的行程生成部分使用流式;
+            # 读写 session.memory 的这一步排进会话的轮次链, 不与同一会话的其他请求交错
+            result = await _submit_turn(
+                session, functools.partial(_stream_parse_intent, session, request.text)
             )
-            from NLU_module.agents.adviser.adviser_rag import call_rag_api
-            from NLU_module.agents.adviser.adviser_recommendation import (
-                generate_recommendations_stream,
-            )
-
-            result = (
-                await run_intent_parsing(
-                    session_nlu.adviser.llm,
-                    request.text,
-                    session_nlu.adviser.memory.get("history", []),
-                    debug=True,
-                )
-                or {}
-            )
-
-            intent_cur = result.get("intent_parsed", {})
-
-            # 合并历史上下文
-            from NLU_module.agents.adviser.adviser_main import merge_partial
-
-            intent_merged = merge_partial(session_nlu.adviser.memory, intent_cur)
 
             # 检查是否需要追问（简化版，暂不支持流式追问）
             if not result.get("intent_parsed", {}).get("dest_pref"):
@@ -287,65 +668,55 @@ async def nlu_simple_stream(request: NLURequest):
                         "message": "需要更多信息：请提供目的地",
                     }
                 )
-                yield "data: [DONE]\n\n"
+                yield _SSE_DONE
                 return
 
-            session_nlu.adviser.memory = intent_merged
-            result["intent_parsed"] = intent_merged
+            yield _SSE_PHASE_END["intent_parsing"]
 
-            yield _sse_event({"type": "phase_end", "phase": "intent_parsing"})
+            # plan_actions / aggregate 只依赖 intent_parsed, 在 RAG 之前启动, 与 RAG 往返重叠
+            plan_task = asyncio.create_task(
+                run_plan_actions(engine.adviser.llm, result["intent_parsed"])
+            )
+            aggregate_task = asyncio.create_task(
+                run_aggregate(engine.adviser.llm, [], result["intent_parsed"])
+            )
+            pending += (plan_task, aggregate_task)
 
             # === 阶段 2: RAG 检索 ===
-            yield _sse_event({"type": "phase_start", "phase": "rag_search"})
+            yield _SSE_PHASE_START["rag_search"]
 
             task_type = result["intent_parsed"].get("task_type", "itinerary")
-            logger.info(f"🔍 [Stream {sid}] task_type = {task_type}")  # 查看识别的类型
+            logger.info(
+                "🔍 [Stream %s] task_type = %s", sid, task_type
+            )  # 查看识别的类型
             city_list = result["intent_parsed"].get("dest_pref", [])
-            city_raw = city_list[0] if city_list else ""
-
-            # 城市映射
-            city_map = {
-                "巴黎": "Paris",
-                "伦敦": "London",
-                "东京": "Tokyo",
-                "上海": "Shanghai",
-                "北京": "Beijing",
-            }
-            city = city_map.get(city_raw, city_raw)
-
-            if task_type == "itinerary":
-                query_text = f"{city} attractions restaurants hotels travel guide"
-            else:
-                query_text = f"{city} recommendations"
+            # 城市映射 (与非流式路径共用模块级 CITY_MAP)
+            city = CITY_MAP.get(city_list[0], city_list[0]) if city_list else ""
 
-            rag_results = await call_rag_api(query_text, city, top_k=5, debug=True)
+            query_text = build_query_text(task_type, city)
+            rag_results, cache_hit = await call_rag_api_cached(
+                query_text, city, top_k=5, debug=True
+            )
 
             yield _sse_event(
                 {
                     "type": "phase_end",
                     "phase": "rag_search",
-                    "result": {"count": len(rag_results)},
+                    "result": {"count": len(rag_results), "cache_hit": cache_hit},
                 }
             )
 
             # === 阶段 3: 内容生成 (并发调用) ===
-            yield _sse_event({"type": "phase_start", "phase": "content_generation"})
-
-            from NLU_module.agents.adviser.adviser_aggregate import run_aggregate
-            from NLU_module.agents.adviser.adviser_context import run_context_summary
-            from NLU_module.agents.adviser.adviser_plan_actions import run_plan_actions
+            yield _SSE_PHASE_START["content_generation"]
 
-            doc_summaries = [f"{r['title']}: {r['content'][:200]}" for r in rag_results]
+            doc_summaries = [
+                f"{title}: {content[:200]}"
+                for title, content in map(_title_content, rag_results)
+            ]
 
-            # 并发执行
+            # context_summary 依赖 RAG 结果, 与已在运行的 plan/aggregate 一起等待
             context_task = run_context_summary(
-                session_nlu.adviser.llm, request.text, doc_summaries
-            )
-            plan_task = run_plan_actions(
-                session_nlu.adviser.llm, result["intent_parsed"]
-            )
-            aggregate_task = run_aggregate(
-                session_nlu.adviser.llm, [], result["intent_parsed"]
+                engine.adviser.llm, request.text, doc_summaries
             )
 
             results_concurrent = await asyncio.gather(
@@ -366,54 +737,60 @@ async def nlu_simple_stream(request: NLURequest):
             result["plan_steps"] = plan_steps
             result["final_aggregation"] = final_aggregation
 
-            yield _sse_event({"type": "phase_end", "phase": "content_generation"})
+            yield _SSE_PHASE_END["content_generation"]
 
             # === 阶段 4: 内容生成 (流式) ===
             if task_type == "itinerary":
-                yield _sse_event(
-                    {"type": "phase_start", "phase": "itinerary_generation"}
-                )
+                yield _SSE_PHASE_START["itinerary_generation"]
 
                 # 使用流式生成
-                async for token in generate_itinerary_stream(
-                    session_nlu.adviser.llm, result, rag_results, debug=True
-                ):
-                    yield _sse_event({"type": "token", "delta": token})
+                tokens = _bounded_tokens(
+                    generate_itinerary_stream(
+                        engine.adviser.llm, result, rag_results, debug=True
+                    )
+                )
+                async with aclosing(tokens):
+                    async for token in tokens:
+                        yield _sse_event({"type": "token", "delta": token})
 
-                yield _sse_event({"type": "phase_end", "phase": "itinerary_generation"})
+                yield _SSE_PHASE_END["itinerary_generation"]
 
             elif task_type == "recommendation":
-                yield _sse_event(
-                    {"type": "phase_start", "phase": "recommendation_generation"}
-                )
+                yield _SSE_PHASE_START["recommendation_generation"]
 
                 # 使用流式生成推荐
-                async for token in generate_recommendations_stream(
-                    session_nlu.adviser.llm, result, rag_results, debug=True
-                ):
-                    yield _sse_event({"type": "token", "delta": token})
-
-                yield _sse_event(
-                    {"type": "phase_end", "phase": "recommendation_generation"}
+                tokens = _bounded_tokens(
+                    generate_recommendations_stream(
+                        engine.adviser.llm, result, rag_results, debug=True
+                    )
                 )
+                async with aclosing(tokens):
+                    async for token in tokens:
+                        yield _sse_event({"type": "token", "delta": token})
+
+                yield _SSE_PHASE_END["recommendation_generation"]
 
             # === 完成 ===
             yield _sse_event({"type": "end", "session_id": sid, "status": "complete"})
-            yield "data: [DONE]\n\n"
+            yield _SSE_DONE
 
-            logger.info(f"[Stream {sid}] 处理完成")
+            logger.info("[Stream %s] 处理完成", sid)
 
         except asyncio.TimeoutError:
-            logger.error(f"[Stream {sid}] 处理超时")
+            logger.error("[Stream %s] 处理超时", sid)
             yield _sse_event(
                 {"type": "error", "message": f"处理超时 (>{REQUEST_TIMEOUT}s)"}
             )
-            yield "data: [DONE]\n\n"
+            yield _SSE_DONE
 
         except Exception as e:
-            logger.error(f"[Stream {sid}] 处理失败: {e}")
+            logger.error("[Stream %s] 处理失败: %s", sid, e)
             yield _sse_event({"type": "error", "message": str(e)})
-            yield "data: [DONE]\n\n"
+            yield _SSE_DONE
+
+        finally:
+            for task in pending:
+                task.cancel()
 
     return StreamingResponse(
         generate_events(),
@@ -444,6 +821,21 @@ async def delete_session(session_id: str):
         return {"success": False, "message": f"会话 {session_id} 不存在"}
 
 
+@app.put("/nlu/sessions/limit")
+async def set_session_limit(request: SessionLimitRequest):
+    """
+    运行时调整会话上限 (运维接口)
+
+    Args:
+        request: 新的会话上限
+
+    Returns:
+        调整后的上限与当前会话数
+    """
+    await resize_sessions(request.max_sessions)
+    return {"success": True, "max_sessions": MAX_SESSIONS, "sessions": len(SESSIONS)}
+
+
 @app.get("/health")
 async def health():
     """健康检查"""
@@ -454,4 +846,8 @@ if __name__ == "__main__":
     import uvicorn
 
     port = int(os.getenv("NLU_API_PORT", "8010"))
-    uvicorn.run(app, host="0.0.0.0", port=8010)
+    # uvloop / httptools 随 uvicorn[standard] 安装 (Windows 上没有 uvloop), 缺失时回退到默认实现
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    # 会话缓存 (SESSIONS) 在进程内, 保持单 worker; 多进程扩展需要先把会话移到外部存储
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop, http=http)
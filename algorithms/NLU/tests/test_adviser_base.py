@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from NLU_module.agents.adviser.adviser_base import AdviserBase
+
+
+def _local_adviser() -> AdviserBase:
+    """不加载模型的本地 Adviser, 只带批处理所需的状态"""
+    adviser = AdviserBase.__new__(AdviserBase)
+    adviser.name = "deepseek"
+    adviser._hf_queue = None
+    adviser._hf_batcher = None
+    adviser._generate_batch = lambda prompts, max_new_tokens: [
+        f"{p}:{n}" for p, n in zip(prompts, max_new_tokens)
+    ]
+    return adviser
+
+
+def test_batcher_restart_keeps_queued_requests():
+    adviser = _local_adviser()
+
+    async def scenario():
+        adviser._ensure_hf_batcher()
+        queue = adviser._hf_queue
+        adviser._hf_batcher.cancel()
+        await asyncio.gather(adviser._hf_batcher, return_exceptions=True)
+
+        # 批处理任务已退出时进入队列的请求, 由重启后的任务接着处理
+        future = asyncio.get_running_loop().create_future()
+        await queue.put(("p", 4, future))
+        adviser._ensure_hf_batcher()
+        assert adviser._hf_queue is queue
+        assert await asyncio.wait_for(future, 1) == "p:4"
+        adviser._hf_batcher.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_batcher_on_new_loop_fails_requests_left_in_old_queue():
+    adviser = _local_adviser()
+
+    async def first_loop():
+        adviser._ensure_hf_batcher()
+        adviser._hf_batcher.cancel()
+        await asyncio.gather(adviser._hf_batcher, return_exceptions=True)
+        future = asyncio.get_running_loop().create_future()
+        adviser._hf_queue.put_nowait(("p", 4, future))
+        return future
+
+    orphan = asyncio.run(first_loop())
+
+    async def second_loop():
+        old_queue = adviser._hf_queue
+        adviser._ensure_hf_batcher()
+        assert adviser._hf_queue is not old_queue
+        adviser._hf_batcher.cancel()
+
+    asyncio.run(second_loop())
+    assert isinstance(orphan.exception(), RuntimeError)
+
+
+def test_generate_batch_left_pads_and_trims_per_item():
+    torch = pytest.importorskip("torch")
+    pad_id = 0
+    captured = {}
+
+    class _Tokenizer:
+        eos_token_id = pad_id
+
+        def decode(self, ids, skip_special_tokens=True):
+            return ",".join(str(int(i)) for i in ids)
+
+    class _Model:
+        def generate(self, input_ids, attention_mask, max_new_tokens, **kwargs):
+            captured.update(
+                input_ids=input_ids.cpu(),
+                attention_mask=attention_mask.cpu(),
+                max_new_tokens=max_new_tokens,
+            )
+            # 第 i 条生成 max_new_tokens 个 100 + i
+            new = torch.tensor(
+                [[100 + i] * max_new_tokens for i in range(len(input_ids))],
+                device=input_ids.device,
+            )
+            return torch.cat([input_ids, new], dim=-1)
+
+    adviser = AdviserBase.__new__(AdviserBase)
+    adviser.tokenizer = _Tokenizer()
+    adviser.hf_model = _Model()
+
+    texts = adviser._generate_batch(
+        [torch.tensor([7, 8, 9]), torch.tensor([5])], max_new_tokens=[2, 3]
+    )
+
+    assert captured["input_ids"].tolist() == [[7, 8, 9], [pad_id, pad_id, 5]]
+    assert captured["attention_mask"].tolist() == [[1, 1, 1], [0, 0, 1]]
+    assert captured["max_new_tokens"] == 3
+    # 只返回新生成的部分, 并按各自的 max_new_tokens 截断
+    assert texts == ["100,100", "101,101,101"]
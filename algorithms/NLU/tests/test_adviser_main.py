@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from NLU_module.agents.adviser import adviser_main
+from NLU_module.agents.adviser.adviser_main import Adviser
+
+
+def test_rag_failure_cancels_started_llm_calls(monkeypatch):
+    cancelled = []
+
+    async def _slow_llm_call(name):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async def _intent(*args, **kwargs):
+        return {"intent_parsed": {"task_type": "itinerary", "dest_pref": ["巴黎"]}}
+
+    async def _rag(*args, **kwargs):
+        await asyncio.sleep(0)  # RAG 往返期间 plan / aggregate 已开始执行
+        raise ConnectionError("RAG 不可用")
+
+    monkeypatch.setattr(adviser_main, "run_intent_parsing", _intent)
+    monkeypatch.setattr(adviser_main, "call_rag_api_cached", _rag)
+    monkeypatch.setattr(
+        adviser_main, "run_plan_actions", lambda *a: _slow_llm_call("plan")
+    )
+    monkeypatch.setattr(
+        adviser_main, "run_aggregate", lambda *a: _slow_llm_call("aggregate")
+    )
+    adviser = Adviser.__new__(Adviser)
+    adviser.llm = None
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await adviser.generate_response(
+                "去巴黎玩三天", skip_clarifier=True, memory={"task_type": "itinerary"}
+            )
+        await asyncio.sleep(0)  # 让被取消的任务处理 CancelledError
+        assert sorted(cancelled) == ["aggregate", "plan"]
+
+    asyncio.run(scenario())
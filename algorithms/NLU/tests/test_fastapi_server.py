@@ -0,0 +1,195 @@
+import asyncio
+import functools
+
+import fastapi_server as server
+
+
+class _Session:
+    """只带会话锁的轻量会话, 代替 NLUSession (不创建日志文件)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = asyncio.Lock()
+
+
+class _BlockingEngine:
+    """busy 会话的每一轮都阻塞到 release 被设置, 其他会话立即返回"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls: list[str] = []
+
+    async def run(self, session, text):
+        self.calls.append(text)
+        if session.name == "busy":
+            await self.release.wait()
+        return {"text": text}
+
+
+def test_same_session_turns_do_not_starve_other_sessions(monkeypatch):
+    workers = 2
+
+    async def scenario():
+        work_queue = asyncio.Queue(maxsize=16)
+        engine = _BlockingEngine()
+        monkeypatch.setattr(server, "engine", engine)
+        monkeypatch.setattr(server, "_work_queue", work_queue)
+        monkeypatch.setattr(server, "_session_turns", {})
+        worker_tasks = [
+            asyncio.create_task(server._worker_loop(work_queue)) for _ in range(workers)
+        ]
+        busy, other = _Session("busy"), _Session("other")
+        try:
+            # 同一会话并发提交 N+1 轮, 再提交另一个会话的一轮
+            busy_turns = [
+                asyncio.create_task(server._run_turn(busy, f"b{i}"))
+                for i in range(workers + 1)
+            ]
+            await asyncio.sleep(0)
+            other_result = await asyncio.wait_for(server._run_turn(other, "o"), 1)
+            assert other_result == {"text": "o"}
+
+            engine.release.set()
+            results = await asyncio.wait_for(asyncio.gather(*busy_turns), 1)
+            assert [r["text"] for r in results] == [f"b{i}" for i in range(workers + 1)]
+            # 同一会话的轮次按提交顺序依次执行
+            assert [c for c in engine.calls if c != "o"] == [
+                f"b{i}" for i in range(workers + 1)
+            ]
+            assert not server._session_turns
+        finally:
+            for task in worker_tasks:
+                task.cancel()
+            await asyncio.gather(*worker_tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+class _ClosableSession(_Session):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_lru_eviction_skips_busy_sessions(monkeypatch):
+    busy, idle, recent = (_ClosableSession(n) for n in ("busy", "idle", "recent"))
+    sessions = server.OrderedDict(busy=busy, idle=idle, recent=recent)
+    monkeypatch.setattr(server, "SESSIONS", sessions)
+    monkeypatch.setattr(server, "_session_turns", {busy: server.deque()})
+
+    server._evict_lru_sessions(1)
+    assert list(sessions) == ["busy"]
+    assert idle.closed and recent.closed and not busy.closed
+
+    # 只剩正在处理的会话时宁可暂时超过上限, 也不关闭它
+    server._evict_lru_sessions(0)
+    assert list(sessions) == ["busy"]
+    assert not busy.closed
+
+
+def test_delete_busy_session_closes_after_last_turn(monkeypatch):
+    async def scenario():
+        work_queue = asyncio.Queue(maxsize=16)
+        engine = _BlockingEngine()
+        busy = _ClosableSession("busy")
+        monkeypatch.setattr(server, "engine", engine)
+        monkeypatch.setattr(server, "_work_queue", work_queue)
+        monkeypatch.setattr(server, "_session_turns", {})
+        monkeypatch.setattr(server, "_closing_sessions", set())
+        monkeypatch.setattr(server, "SESSIONS", server.OrderedDict(busy=busy))
+        worker = asyncio.create_task(server._worker_loop(work_queue))
+        try:
+            turns = [
+                asyncio.create_task(server._run_turn(busy, f"b{i}")) for i in range(2)
+            ]
+            await asyncio.sleep(0.01)
+
+            assert server._delete_session("busy")
+            assert "busy" not in server.SESSIONS
+            assert not busy.closed  # 仍有轮次未处理完, 延后关闭
+
+            engine.release.set()
+            await asyncio.wait_for(asyncio.gather(*turns), 1)
+            assert busy.closed
+            assert not server._closing_sessions
+        finally:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_bounded_tokens_emits_first_frame_without_window(monkeypatch):
+    monkeypatch.setattr(server, "STREAM_COALESCE_MS", 10_000)
+
+    async def scenario():
+        async def token_stream():
+            yield "你"
+            await asyncio.Event().wait()  # 后续 token 迟迟不来
+
+        tokens = server._bounded_tokens(token_stream())
+        try:
+            # 攒批窗口 10s, 首个片段仍应立即发出
+            assert await asyncio.wait_for(anext(tokens), 1) == "你"
+        finally:
+            await tokens.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_stream_intent_turn_waits_for_running_turn_on_same_session(monkeypatch):
+    class _MemoryEngine:
+        """engine.run 读出会话记忆, 阻塞一段时间后写回 (模拟一轮完整的读改写)"""
+
+        adviser = type("_Adviser", (), {"llm": None})()
+
+        def __init__(self):
+            self.release = asyncio.Event()
+
+        async def run(self, session, text):
+            memory = dict(session.memory)
+            await self.release.wait()
+            session.memory = {**memory, "budget_total_cny": 1000}
+            return {"text": text}
+
+    async def _intent(llm, text, history, debug=False):
+        return {"intent_parsed": {"dest_pref": ["巴黎"]}}
+
+    async def scenario():
+        work_queue = asyncio.Queue(maxsize=16)
+        engine = _MemoryEngine()
+        monkeypatch.setattr(server, "engine", engine)
+        monkeypatch.setattr(server, "run_intent_parsing", _intent)
+        monkeypatch.setattr(server, "_work_queue", work_queue)
+        monkeypatch.setattr(server, "_session_turns", {})
+        workers = [
+            asyncio.create_task(server._worker_loop(work_queue)) for _ in range(2)
+        ]
+        session = _Session("busy")
+        session.memory = {}
+        try:
+            turn = asyncio.create_task(server._run_turn(session, "预算 1000"))
+            await asyncio.sleep(0.01)
+            stream_turn = asyncio.create_task(
+                server._submit_turn(
+                    session,
+                    functools.partial(server._stream_parse_intent, session, "去巴黎"),
+                )
+            )
+            await asyncio.sleep(0.01)
+            # 流式请求的意图解析排在进行中的一轮之后, 不读取到中间状态
+            assert not stream_turn.done() and session.memory == {}
+
+            engine.release.set()
+            await asyncio.wait_for(asyncio.gather(turn, stream_turn), 1)
+            assert session.memory["budget_total_cny"] == 1000
+            assert session.memory["dest_pref"] == ["巴黎"]
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from NLU_module.main import NLUEngine
+
+
+class _Session:
+    def __init__(self):
+        self.memory = {}
+        self.logs: list[str] = []
+
+    def _log(self, text):
+        self.logs.append(text)
+
+
+class _Adviser:
+    """依次返回各候选的行为: Exception 表示生成失败, (延迟, 名称) 表示延迟后生成该候选"""
+
+    def __init__(self, plans):
+        self.plans = iter(plans)
+        self.cancelled: list[str] = []
+
+    async def generate_response(self, *args, **kwargs):
+        plan = next(self.plans)
+        if isinstance(plan, Exception):
+            raise plan
+        delay, name = plan
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        return {"name": name}
+
+
+class _Verifier:
+    def __init__(self, safe: set[str]):
+        self.safe = safe
+
+    async def assess_cur_response(self, response):
+        ok = response["name"] in self.safe
+        return ("ok" if ok else f"{response['name']} 有问题"), ok
+
+
+def _engine(plans, safe) -> NLUEngine:
+    engine = NLUEngine.__new__(NLUEngine)
+    engine.adviser = _Adviser(plans)
+    engine.verifier = _Verifier(safe)
+    engine.regen_candidates = len(plans)
+    return engine
+
+
+def test_regenerate_drops_failed_candidates_and_cancels_rest():
+    engine = _engine(
+        [RuntimeError("LLM 超时"), (0.01, "fast"), (10, "slow")], safe={"fast"}
+    )
+
+    async def scenario():
+        result = await engine._regenerate(_Session(), "修正", [])
+        await asyncio.sleep(0)
+        return result
+
+    response, explanation, is_safe = asyncio.run(scenario())
+    assert (response, explanation, is_safe) == ({"name": "fast"}, "ok", True)
+    assert engine.adviser.cancelled == ["slow"]
+
+
+def test_regenerate_falls_back_to_first_finished_candidate():
+    engine = _engine([(0.02, "late"), (0.01, "early")], safe=set())
+
+    response, explanation, is_safe = asyncio.run(
+        engine._regenerate(_Session(), "修正", [])
+    )
+    assert response == {"name": "early"} and not is_safe
+
+
+def test_regenerate_raises_when_every_candidate_fails():
+    engine = _engine([RuntimeError("a"), RuntimeError("b")], safe=set())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine._regenerate(_Session(), "修正", []))
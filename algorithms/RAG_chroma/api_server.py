@@ -2,16 +2,20 @@
 RAG API 服务
 """
 
+import asyncio
+import functools
+import importlib.util
 import os
 import sys
 from typing import Any, Dict, List, Optional
 
+import numpy as np
 from db import init_db
-from embedder import get_embedding_dimension, warmup_models
+from embedder import embed_texts, get_embedding_dimension, warmup_models
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from search import search
+from search import expand_query, search
 
 app = FastAPI(
     title="RAG Chroma API", description="RAG Chroma 向量搜索服务", version="0.1.0"
@@ -27,6 +31,97 @@ app.add_middleware(
 )
 
 
+# query 编码的动态批处理: 后台任务最多等待 EMBED_BATCH_WAIT_MS 毫秒凑齐 EMBED_BATCH_MAX_SIZE 条 query,
+# 一次 encode 整批, 并发请求不再各自单条编码
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "20"))
+_embed_queue: Optional[asyncio.Queue] = None
+_embed_batcher: Optional[asyncio.Task] = None
+
+
+async def embed_query(text: str) -> np.ndarray:
+    """把 query 交给批处理后台任务编码，返回该 query 的向量"""
+    _ensure_embed_batcher()
+    future = asyncio.get_running_loop().create_future()
+    await _embed_queue.put((text, future))
+    return await future
+
+
+def _ensure_embed_batcher():
+    """
+    按需（重新）启动批处理后台任务
+
+    同一事件循环内重启时沿用原队列，排队中的 query 由新任务接着编码；
+    换了事件循环时旧队列无法再使用，其中的请求以异常结束。
+    """
+    global _embed_queue, _embed_batcher
+    if _embed_batcher is not None and not _embed_batcher.done():
+        return
+    loop = asyncio.get_running_loop()
+    if _embed_batcher is None or _embed_batcher.get_loop() is not loop:
+        if _embed_queue is not None:
+            _fail_embed_queue(
+                _embed_queue, RuntimeError("query 编码批处理任务已在新的事件循环中重启")
+            )
+        _embed_queue = asyncio.Queue()
+    _embed_batcher = loop.create_task(_embed_batch_loop(_embed_queue))
+
+
+def _fail_embed_queue(queue: asyncio.Queue, error: Exception):
+    """清空批处理队列，其中尚未完成的请求以 error 结束"""
+    while not queue.empty():
+        _, future = queue.get_nowait()
+        if not future.done():
+            try:
+                future.set_exception(error)
+            except RuntimeError:
+                pass  # future 所属的事件循环已关闭，不会再有人等待它
+
+
+async def _embed_batch_loop(queue: asyncio.Queue):
+    """query 编码的批处理后台任务: 收集一批 query，在线程池中一次编码"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    try:
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + EMBED_BATCH_WAIT_MS / 1000
+            while len(batch) < EMBED_BATCH_MAX_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except TimeoutError:
+                    break
+
+            # 调用方已取消（如客户端断开）的不再编码
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+            try:
+                vectors = await loop.run_in_executor(
+                    None, embed_texts, [text for text, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+    except BaseException as e:
+        # 任务被取消或意外退出: 正在编码的和仍在排队的请求都以异常结束，避免调用方一直等到超时
+        error = RuntimeError("query 编码批处理任务已退出")
+        error.__cause__ = e
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+        _fail_embed_queue(queue, error)
+        raise
+
+
 class SearchRequest(BaseModel):
     """搜索请求"""
 
@@ -34,6 +129,7 @@ class SearchRequest(BaseModel):
     city: Optional[str] = None
     day: Optional[str] = None
     top_k: Optional[int] = None
+    content_max_chars: Optional[int] = None  # 截断每条结果的 content，None 表示不截断
 
 
 class SearchResponse(BaseModel):
@@ -59,32 +155,33 @@ async def startup_event():
         # 不中断启动，允许后续重试
 
 
-def format_contexts(results: List[Dict[str, Any]]) -> str:
-    """将搜索结果格式化为上下文字符串（类似 backend tools.py 的 format_contexts）"""
-    if not results:
-        return ""
+_CONTEXT_SEPARATOR = "\n\n---\n\n"
 
-    formatted = []
-    for result in results:
-        content = result.get("content", "").strip()
-        city = result.get("city", "")
-        title = result.get("title", "")
-        url = result.get("url", "")
 
-        # 构建格式化文本
-        parts = []
-        if title:
-            parts.append(f"[{title}]")
-        if city:
-            parts.append(f"城市: {city}")
-        if url:
-            parts.append(f"链接: {url}")
-        if content:
-            parts.append(f"\n{content}")
+def _format_context(result: Dict[str, Any]) -> str:
+    """格式化单条搜索结果: 标题 / 城市 / 链接各占一行，正文与头部之间空一行"""
+    title = result.get("title", "")
+    city = result.get("city", "")
+    url = result.get("url", "")
+    content = result.get("content", "").strip()
 
-        formatted.append("\n".join(parts))
+    head = "\n".join(
+        seg
+        for seg in (
+            f"[{title}]" if title else "",
+            f"城市: {city}" if city else "",
+            f"链接: {url}" if url else "",
+        )
+        if seg
+    )
+    if not content:
+        return head
+    return f"{head}\n\n{content}" if head else f"\n{content}"
 
-    return "\n\n---\n\n".join(formatted)
+
+def format_contexts(results: List[Dict[str, Any]]) -> str:
+    """将搜索结果格式化为上下文字符串（类似 backend tools.py 的 format_contexts）"""
+    return _CONTEXT_SEPARATOR.join(map(_format_context, results))
 
 
 @app.post("/search", response_model=SearchResponse)
@@ -98,11 +195,31 @@ async def search_api(request: SearchRequest):
         if not request.query or not request.query.strip():
             raise HTTPException(status_code=400, detail="查询不能为空")
 
+        # query 编码与并发请求合批
+        query_embedding = await embed_query(expand_query(request.query))
+
         # 执行搜索（支持 day 软优先，与 CLI 行为一致）
-        results = search(
-            query=request.query, city=request.city, day=request.day, top_k=request.top_k
+        # Chroma 查询 / 重排序是同步阻塞调用，放到线程池中执行，不阻塞事件循环
+        results = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                search,
+                query=request.query,
+                city=request.city,
+                day=request.day,
+                top_k=request.top_k,
+                query_embedding=query_embedding,
+            ),
         )
 
+        # 只需要摘要的调用方可以要求截断 content，减少响应体积
+        if request.content_max_chars is not None:
+            limit = max(request.content_max_chars, 0)
+            for result in results:
+                content = result.get("content")
+                if content and len(content) > limit:
+                    result["content"] = content[:limit]
+
         # 格式化上下文
         contexts = format_contexts(results)
 
@@ -122,4 +239,16 @@ if __name__ == "__main__":
 
     # 默认端口 8001，避免与 backend 的 8000 冲突
     port = int(os.getenv("RAG_API_PORT", "8001"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop / httptools 随 uvicorn[standard] 安装 (Windows 上没有 uvloop)，缺失时回退到默认实现
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    # 服务无状态，可以多进程；每个 worker 各自加载一份 embedding 模型，默认单进程
+    workers = int(os.getenv("RAG_API_WORKERS", "1"))
+    uvicorn.run(
+        "api_server:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=port,
+        loop=loop,
+        http=http,
+        workers=workers,
+    )
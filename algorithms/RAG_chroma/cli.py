@@ -1,9 +1,9 @@
 import argparse
-import json
 import sys
 from pathlib import Path
 from typing import Optional
 
+import orjson
 from db import init_db
 from embedder import get_embedding_dimension
 from rag import build_prompt
@@ -33,15 +33,13 @@ def main():
         if not input_file.exists():
             print(f"错误：未找到 question.json 文件: {input_file}", file=sys.stderr)
             sys.exit(1)
-        with open(input_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = orjson.loads(input_file.read_bytes())
     elif args.input == "-":
         # 从标准输入读取
-        data = json.loads(sys.stdin.read())
+        data = orjson.loads(sys.stdin.buffer.read())
     else:
         # 从指定文件读取
-        with open(args.input, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = orjson.loads(Path(args.input).read_bytes())
 
     question: str = data.get("question") or data.get("query") or ""
     if not question:
@@ -17,6 +17,8 @@ class Settings:
     model_name: str = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
     batch_size: int = int(os.getenv("EMBED_BATCH", "64"))
     normalize_embeddings: bool = os.getenv("EMBED_NORMALIZE", "1") == "1"
+    # GPU 上以半精度运行 embedding 模型（吞吐更高；输出仍转为 float32）
+    embed_fp16: bool = os.getenv("EMBED_FP16", "0") == "1"
     # when JSON already contains embeddings, reuse them in ingest
     use_json_embeddings: bool = os.getenv("USE_JSON_EMBEDDINGS", "1") == "1"
 
@@ -35,6 +37,7 @@ class Settings:
     # reranking
     use_reranking: bool = os.getenv("USE_RERANKING", "0") == "1"
     rerank_top_k: int = int(os.getenv("RERANK_TOP_K", "20"))
+    rerank_batch_size: int = int(os.getenv("RERANK_BATCH", "32"))
     rerank_model_name: str = os.getenv(
         "RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
     )
@@ -7,7 +7,7 @@ import re
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 
 # ===================== 可配置参数 =====================
 DATA_DIR = Path(__file__).parent / "data" / "paris"
@@ -18,6 +18,10 @@ DEFAULT_CITY = "Paris"
 DEFAULT_COUNTRY_CODE = "fr"
 DEFAULT_LANG = "zh"
 
+# 空白折叠与句子边界 (句末标点之后的空白)
+_WS_RE = re.compile(r"\s+")
+_SENT_BOUNDARY_RE = re.compile(r"(?<=[。？！!?\.])\s+")
+
 
 @dataclass
 class TxtRecord:
@@ -39,11 +43,13 @@ def parse_structured_txt(path: Path) -> TxtRecord:
             line = raw_line.rstrip("\n")
             stripped = line.strip()
 
+            # 标签行形如 【key】value；一次 find 同时判断是否为标签行并定位 key 的结尾
+            tag_end = stripped.find("】") if stripped[:1] == "【" else -1
+
             if not context_started:
-                if stripped.startswith("【") and "】" in stripped:
-                    key, value = stripped.split("】", 1)
-                    key = _normalize_key(key[1:])
-                    value = value.strip()
+                if tag_end > 0:
+                    key = _normalize_key(stripped[1:tag_end])
+                    value = stripped[tag_end + 1 :].strip()
                     if key == "context":
                         context_started = True
                         if value:
@@ -54,10 +60,9 @@ def parse_structured_txt(path: Path) -> TxtRecord:
                     # 忽略 context 之前的非标签行
                     continue
             else:
-                if stripped.startswith("【") and "】" in stripped:
+                if tag_end > 0:
                     # context 开始之后所有内容都视为正文，去掉额外标签
-                    _, value = stripped.split("】", 1)
-                    value = value.strip()
+                    value = stripped[tag_end + 1 :].strip()
                     if value:
                         context_lines.append(value)
                 else:
@@ -67,37 +72,42 @@ def parse_structured_txt(path: Path) -> TxtRecord:
     return TxtRecord(headers=headers, context=context)
 
 
+def _sentence_spans(cleaned: str) -> Iterator[Tuple[int, int]]:
+    """按句末标点后的空白切句，返回每句在 cleaned 中的 (起, 止) 位置"""
+    start = 0
+    for m in _SENT_BOUNDARY_RE.finditer(cleaned):
+        yield start, m.start()
+        start = m.end()
+    yield start, len(cleaned)
+
+
 def chunk_text(text: str, min_len: int = 200, max_len: int = 500) -> List[str]:
-    cleaned = re.sub(r"\s+", " ", text).strip()
+    cleaned = _WS_RE.sub(" ", text).strip()
     if not cleaned:
         return []
 
-    sentences = re.split(r"(?<=[。？！!?\.])\s+", cleaned)
     chunks: List[str] = []
-    buffer: List[str] = []
-    length = 0
-
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence:
-            continue
-
-        sentence_length = len(sentence)
-        if length + sentence_length > max_len:
-            if buffer:
-                chunks.append("".join(buffer))
-            buffer = [sentence]
-            length = sentence_length
+    # 当前块在 cleaned 中的范围 [chunk_start, chunk_end)，chunk_start 为 None 表示空块；
+    # 成块时直接切片，句子之间保留原文的空格
+    chunk_start: int | None = None
+    chunk_end = 0
+
+    for start, end in _sentence_spans(cleaned):
+        length = end - (start if chunk_start is None else chunk_start)
+        if length > max_len:
+            if chunk_start is not None:
+                chunks.append(cleaned[chunk_start:chunk_end])
+            chunk_start, chunk_end = start, end
         else:
-            buffer.append(sentence)
-            length += sentence_length
+            if chunk_start is None:
+                chunk_start = start
+            chunk_end = end
             if length >= min_len:
-                chunks.append("".join(buffer))
-                buffer = []
-                length = 0
+                chunks.append(cleaned[chunk_start:chunk_end])
+                chunk_start = None
 
-    if buffer:
-        chunks.append("".join(buffer))
+    if chunk_start is not None:
+        chunks.append(cleaned[chunk_start:chunk_end])
 
     # 去除过短片段
     return [chunk for chunk in chunks if len(chunk) >= 50]
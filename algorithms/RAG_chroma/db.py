@@ -1,7 +1,8 @@
-import json
 from typing import List, Optional, Sequence
 
 import chromadb
+import numpy as np
+import orjson
 from chromadb.config import Settings as ChromaSettings
 from config import settings
 
@@ -9,6 +10,10 @@ type ClientAPI = chromadb.ClientAPI  # pyright: ignore[reportPrivateImportUsage]
 
 _client: ClientAPI | None = None
 _collection: chromadb.Collection | None = None
+# 已完成 init_db 的向量维度, 相同维度重复初始化时直接返回
+_initialized_dim: int | None = None
+# get_stats 的城市列表缓存, insert_documents / delete_by_source 写入后失效
+_cities_cache: List[str] | None = None
 
 
 def _get_client() -> ClientAPI:
@@ -86,8 +91,12 @@ def _get_collection(embedding_dim: int = 1024) -> chromadb.Collection:
 
 def init_db(embedding_dim: int = 1024) -> None:
     """初始化 Chroma 数据库（创建 collection）"""
+    global _initialized_dim
+    if _initialized_dim == embedding_dim:
+        return
     # 确保 collection 存在且维度正确
     _get_collection(embedding_dim=embedding_dim)
+    _initialized_dim = embedding_dim
     print(f"Chroma 数据库已初始化（维度: {embedding_dim}）")
 
 
@@ -154,7 +163,9 @@ def insert_documents(rows: Sequence[dict], embedding_dim: int = 1024) -> None:
                         metadata[f"meta_{k}"] = str(v)
                     elif isinstance(v, dict):
                         # 嵌套字典转为 JSON 字符串
-                        metadata[f"meta_{k}"] = json.dumps(v, ensure_ascii=False)
+                        metadata[f"meta_{k}"] = orjson.dumps(
+                            v, option=orjson.OPT_NON_STR_KEYS
+                        ).decode()
 
         metadatas.append(metadata)
 
@@ -162,6 +173,7 @@ def insert_documents(rows: Sequence[dict], embedding_dim: int = 1024) -> None:
     collection.add(
         ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
     )
+    _invalidate_stats()
 
 
 def delete_by_source(source_file: str, embedding_dim: int = 1024) -> None:
@@ -169,22 +181,31 @@ def delete_by_source(source_file: str, embedding_dim: int = 1024) -> None:
     collection = _get_collection(embedding_dim=embedding_dim)
     # Chroma 可以通过 metadata 过滤删除
     collection.delete(where={"source_file": source_file})
+    _invalidate_stats()
+
+
+def _invalidate_stats() -> None:
+    global _cities_cache
+    _cities_cache = None
 
 
 def get_stats(embedding_dim: int = 1024) -> dict:
     """获取数据库统计信息"""
+    global _cities_cache
     collection = _get_collection(embedding_dim=embedding_dim)
     count = collection.count()
 
-    # 获取所有文档以提取城市列表
-    results = collection.get(limit=10000)  # 根据需要调整
-    cities = set()
-    if res := results.get("metadatas"):
-        for meta in res:
-            if meta and "city" in meta:
-                cities.add(meta["city"])
+    if _cities_cache is None:
+        # 只取 metadata 提取城市列表（不拉取 embedding 和正文）
+        results = collection.get(limit=10000, include=["metadatas"])  # 根据需要调整
+        cities = set()
+        if res := results.get("metadatas"):
+            for meta in res:
+                if meta and "city" in meta:
+                    cities.add(meta["city"])
+        _cities_cache = sorted(cities)
 
-    return {"total": count, "cities": sorted(list(cities))}
+    return {"total": count, "cities": list(_cities_cache)}
 
 
 def vector_search(
@@ -229,13 +250,15 @@ def vector_search(
     metas = results["metadatas"][0] if results["metadatas"] else []
     distances = results["distances"][0] if results["distances"] else []
 
-    for i, doc_id in enumerate(ids):
-        # Chroma 使用距离（越小越相似），需要转换为相似度分数
-        # cosine distance: 0 = 完全相同, 2 = 完全相反
-        # 相似度 score = 1 - (distance / 2)，范围 [0, 1]
-        distance = distances[i] if i < len(distances) else 1.0
-        score = 1.0 - (distance / 2.0)  # 转换为相似度分数
+    # Chroma 使用距离（越小越相似），需要转换为相似度分数
+    # cosine distance: 0 = 完全相同, 2 = 完全相反
+    # 相似度 score = 1 - (distance / 2)，范围 [0, 1]；整批一次向量化计算
+    scores = (1.0 - np.asarray(distances, dtype=np.float64) * 0.5).tolist()
+    # 缺失的距离按 1.0 处理（score 0.5）
+    scores.extend([0.5] * (len(ids) - len(scores)))
 
+    for i, doc_id in enumerate(ids):
+        score = scores[i]
         meta = metas[i] if i < len(metas) else {}
         doc_text = docs[i] if i < len(docs) else ""
 
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import threading
+from functools import lru_cache
 from typing import List
 
 import numpy as np
@@ -8,14 +10,24 @@ from sentence_transformers import CrossEncoder, SentenceTransformer
 
 _model: SentenceTransformer | None = None
 _reranker: CrossEncoder | None = None
+# 检索在线程池中执行, 首次请求可能并发触发加载; 加锁保证模型只加载一次
+_model_lock = threading.Lock()
+_reranker_lock = threading.Lock()
 
 
 def _get_model() -> SentenceTransformer:
     global _model
-    if _model is None:
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is not None:
+            return _model
         print(f"正在加载 embedding 模型: {settings.model_name}...")
         print("(首次运行需要下载模型文件，可能需要几分钟，请耐心等待)")
-        _model = SentenceTransformer(settings.model_name)
+        model = SentenceTransformer(settings.model_name)
+        if settings.embed_fp16 and model.device.type == "cuda":
+            model.half()
+            print("embedding 模型以半精度 (fp16) 运行")
         # 显示模型缓存路径
         import os
 
@@ -23,6 +35,8 @@ def _get_model() -> SentenceTransformer:
         print("模型加载完成！")
         hub_path = os.path.join(cache_dir, "hub")
         print(f"模型缓存位置: {hub_path}")
+        # 完全初始化 (含 fp16 转换) 后再发布, 无锁读取的线程不会拿到半成品
+        _model = model
     return _model
 
 
@@ -35,12 +49,13 @@ def embed_texts(texts: List[str]) -> np.ndarray:
         convert_to_numpy=True,
         normalize_embeddings=settings.normalize_embeddings,
     )
-    # Ensure float32 for pgvector
-    return embeddings.astype(np.float32)
+    # Ensure float32 for pgvector (已是 float32 时不复制)
+    return embeddings.astype(np.float32, copy=False)
 
 
+@lru_cache(maxsize=1)
 def get_embedding_dimension() -> int:
-    """返回当前 embedding 模型的向量维度"""
+    """返回当前 embedding 模型的向量维度 (进程内只解析一次)"""
     # BGE-M3 固定为 1024 维
     if "bge-m3" in settings.model_name.lower():
         return 1024
@@ -68,7 +83,11 @@ def get_embedding_dimension() -> int:
 
 def _get_reranker() -> CrossEncoder:
     global _reranker
-    if _reranker is None:
+    if _reranker is not None:
+        return _reranker
+    with _reranker_lock:
+        if _reranker is not None:
+            return _reranker
         print("正在加载重排序模型...")
         print("(首次运行需要下载模型文件，可能需要几分钟，请耐心等待)")
         _reranker = CrossEncoder(settings.rerank_model_name)
@@ -76,14 +95,18 @@ def _get_reranker() -> CrossEncoder:
     return _reranker
 
 
-def rerank(query: str, documents: List[str]) -> List[float]:
-    """使用交叉编码器对文档进行重排序"""
+def rerank(query: str, documents: List[str]) -> np.ndarray:
+    """使用交叉编码器对文档进行重排序，返回与 documents 一一对应的分数数组"""
     if not documents:
-        return []
+        return np.empty(0, dtype=np.float32)
     reranker = _get_reranker()
-    pairs = [[query, doc] for doc in documents]
-    scores = reranker.predict(pairs, show_progress_bar=False)
-    return scores.tolist() if hasattr(scores, "tolist") else list(scores)
+    scores = reranker.predict(
+        [(query, doc) for doc in documents],
+        batch_size=settings.rerank_batch_size,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+    )
+    return np.asarray(scores)
 
 
 def warmup_models() -> None:
@@ -2,13 +2,17 @@
 数据导入脚本：将 data/*.json 文件中的数据导入到 Chroma 数据库
 """
 
-import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
+import orjson
 from db import delete_by_source, init_db, insert_documents
 from embedder import embed_texts, get_embedding_dimension
 
+# 预读 JSON 文件的线程数
+READ_WORKERS = 8
+
 
 def _select_url(urls: Dict[str, Any]) -> str:
     """从 urls 字典中优先选择合适的 URL"""
@@ -26,41 +30,72 @@ def _select_url(urls: Dict[str, Any]) -> str:
     return ""
 
 
-def load_rows_from_file(path: Path) -> List[Dict[str, Any]]:
-    """从单个 JSON 文件加载数据并转换为数据库行格式"""
-    with path.open("r", encoding="utf-8") as fh:
-        payload = json.load(fh)
+def _read_payload(path: Path) -> Dict[str, Any]:
+    """读取单个 JSON 文件"""
+    return orjson.loads(path.read_bytes())
 
-    city = payload.get("city_name") or payload.get("city")
-    language = payload.get("lang") or payload.get("language")
-    timestamp = payload.get("timestamp")  # 从 JSON 文件根级别提取 timestamp
-    urls = payload.get("urls") or {}
-    default_url = _select_url(urls)
+
+def _text_chunks(payload: Dict[str, Any]) -> List[Any] | None:
     knowledge = payload.get("knowledge") or {}
-    chunks = knowledge.get("text_chunks") if isinstance(knowledge, dict) else None
+    return knowledge.get("text_chunks") if isinstance(knowledge, dict) else None
 
-    rows: List[Dict[str, Any]] = []
-    if not isinstance(chunks, list):
-        return rows
 
-    # 收集需要计算 embedding 的文本
-    texts_to_embed: List[str] = []
-    embed_indices: List[int] = []
+def _texts_to_embed(payload: Dict[str, Any]) -> List[Tuple[int, str]]:
+    """收集需要计算 embedding 的 (chunk 序号, 文本)"""
+    chunks = _text_chunks(payload)
+    if not isinstance(chunks, list):
+        return []
+    pending: List[Tuple[int, str]] = []
     for idx, chunk in enumerate(chunks):
         if not isinstance(chunk, dict):
             continue
         if chunk.get("embedding") is None:
             text = chunk.get("text") or chunk.get("content") or ""
             if text:
-                texts_to_embed.append(text)
-                embed_indices.append(idx)
+                pending.append((idx, text))
+    return pending
+
+
+def _prepare_file(path: Path) -> Tuple[Dict[str, Any], List[Tuple[int, str]]]:
+    """读取文件并收集其中待编码的文本（在读取线程池中执行）"""
+    payload = _read_payload(path)
+    return payload, _texts_to_embed(payload)
+
 
-    # 批量计算缺失的 embeddings
-    computed_embeddings: List[Any] = []
-    if texts_to_embed:
-        computed_embeddings = embed_texts(texts_to_embed).tolist()
+def load_rows_from_file(
+    path: Path,
+    payload: Dict[str, Any] | None = None,
+    computed_map: Dict[int, Any] | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    从单个 JSON 文件加载数据并转换为数据库行格式
 
-    computed_map = {i: emb for i, emb in zip(embed_indices, computed_embeddings)}
+    payload: 已读取的文件内容，为 None 时从 path 读取
+    computed_map: 已批量算好的 {chunk 序号: embedding}，为 None 时在此为本文件计算
+    """
+    if payload is None:
+        payload = _read_payload(path)
+
+    city = payload.get("city_name") or payload.get("city")
+    language = payload.get("lang") or payload.get("language")
+    timestamp = payload.get("timestamp")  # 从 JSON 文件根级别提取 timestamp
+    urls = payload.get("urls") or {}
+    default_url = _select_url(urls)
+    chunks = _text_chunks(payload)
+
+    rows: List[Dict[str, Any]] = []
+    if not isinstance(chunks, list):
+        return rows
+
+    if computed_map is None:
+        # 批量计算缺失的 embeddings
+        pending = _texts_to_embed(payload)
+        computed_map = {}
+        if pending:
+            computed_embeddings = embed_texts([text for _, text in pending]).tolist()
+            computed_map = {
+                idx: emb for (idx, _), emb in zip(pending, computed_embeddings)
+            }
 
     # 构建数据库行，同时检查 embedding 维度
     expected_dim = None  # 期望的维度（从第一个 embedding 推断）
@@ -147,10 +182,45 @@ def main() -> None:
     total_rows = 0
     skipped_files = []  # 记录跳过的文件
 
+    # 第一遍：读取所有文件，汇总缺少 embedding 的文本，跨文件一次批量编码
+    payloads: Dict[Path, Dict[str, Any]] = {}
+    pending: List[Tuple[Path, int, str]] = []
+    # 文件读取是 I/O，放到线程池中并发进行；结果按文件顺序处理
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        futures = [executor.submit(_prepare_file, path) for path in json_files]
+    for path, future in zip(json_files, futures):
+        try:
+            payload, file_pending = future.result()
+        except Exception as e:
+            print(f"  ✗ 读取 {path.name} 失败：{e}")
+            skipped_files.append((path.name, f"导入错误: {str(e)}"))
+            continue
+        payloads[path] = payload
+        pending.extend((path, idx, text) for idx, text in file_pending)
+
+    computed: Dict[Path, Dict[int, Any]] | None = {}
+    if pending:
+        print(f"批量计算 {len(pending)} 条文本的 embedding...")
+        try:
+            vectors = embed_texts([text for _, _, text in pending]).tolist()
+            for (path, idx, _), vector in zip(pending, vectors):
+                computed.setdefault(path, {})[idx] = vector
+        except Exception as e:
+            # 整批失败时退回逐文件计算，单个文件出错不影响其他文件
+            print(f"  ✗ 批量计算 embedding 失败，改为逐文件计算：{e}")
+            computed = None
+
+    # 第二遍：逐文件组装数据并写入数据库
     for path in json_files:
+        if path not in payloads:
+            continue
         print(f"\n处理文件: {path.name}")
         try:
-            rows = load_rows_from_file(path)
+            rows = load_rows_from_file(
+                path,
+                payload=payloads[path],
+                computed_map=None if computed is None else computed.get(path, {}),
+            )
             if not rows:
                 print("  跳过：文件中没有有效数据")
                 skipped_files.append((path.name, "文件中没有有效数据"))
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-import json
 from typing import Any, Dict, List
 
+import orjson
+
 MAX_SNIPPET_LENGTH = 500
+# 片段中的换行 / 制表符统一替换为空格 (str.translate 一次扫描完成)
+_WS_TO_SPACE = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
 
 
 def _format_score(score: Any) -> float | None:
@@ -16,7 +19,7 @@ def _format_score(score: Any) -> float | None:
 
 def _truncate_snippet(text: str) -> str:
     """截断文本片段，保留最大长度"""
-    snippet = text.strip().replace("\n", " ")
+    snippet = text.translate(_WS_TO_SPACE).strip()
     if len(snippet) <= MAX_SNIPPET_LENGTH:
         return snippet
     return snippet[:MAX_SNIPPET_LENGTH].rstrip() + "..."
@@ -54,4 +57,5 @@ def build_prompt(question: str, contexts: List[Dict[str, Any]]) -> str:
             }
         )
 
-    return json.dumps(payload, ensure_ascii=False, indent=2)
+    # 紧凑输出, prompt 更短; orjson 默认即输出 UTF-8 原文 (不转义非 ASCII)
+    return orjson.dumps(payload).decode()
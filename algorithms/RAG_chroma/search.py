@@ -31,24 +31,35 @@ def _expand_query(query: str) -> str:
     return query
 
 
+def expand_query(query: str) -> str:
+    """返回实际用于编码检索的查询文本（按配置做查询扩展）"""
+    return _expand_query(query) if settings.use_query_expansion else query
+
+
 def search(
     query: str,
     city: Optional[str] = None,
     day: Optional[str] = None,
     top_k: Optional[int] = None,
+    query_embedding: Optional[np.ndarray] = None,
 ) -> List[Dict[str, Any]]:
+    """
+    query_embedding: 调用方已对 expand_query(query) 编码好的向量（如 API 服务的批量编码），
+        为 None 时在此编码
+    """
     if not query or not query.strip():
         return []
 
-    # 查询扩展
-    expanded_query = _expand_query(query) if settings.use_query_expansion else query
-
     # 初始检索：如果使用重排序，检索更多候选结果
     k = top_k or settings.top_k
     initial_k = settings.rerank_top_k if settings.use_reranking else k
 
     # 使用扩展后的查询进行检索
-    q_emb: np.ndarray = embed_texts([expanded_query])[0]
+    q_emb: np.ndarray = (
+        query_embedding
+        if query_embedding is not None
+        else embed_texts([expand_query(query)])[0]
+    )
     results = vector_search(q_emb.tolist(), top_k=initial_k, city=city)
 
     # 过滤低分结果
@@ -61,31 +72,31 @@ def search(
     if settings.use_reranking and len(filtered) > 1:
         # 使用原始查询（而非扩展后的）进行重排序，更精确
         documents = [r.get("content", "") for r in filtered]
-        rerank_scores = rerank(query, documents)
+        rerank_scores = rerank(query, documents).astype(np.float64, copy=False)
 
         # 归一化重排序分数到 [0, 1] 范围
         # CrossEncoder 输出可能不在 [0,1] 范围，使用 min-max 归一化
-        if rerank_scores:
-            min_rerank = min(rerank_scores)
-            max_rerank = max(rerank_scores)
-            if max_rerank > min_rerank:
-                normalized_rerank = [
-                    (s - min_rerank) / (max_rerank - min_rerank) for s in rerank_scores
-                ]
-            else:
-                normalized_rerank = [1.0] * len(rerank_scores)
+        min_rerank = rerank_scores.min()
+        max_rerank = rerank_scores.max()
+        if max_rerank > min_rerank:
+            normalized_rerank = (rerank_scores - min_rerank) / (max_rerank - min_rerank)
         else:
-            normalized_rerank = []
-
-        # 合并原始分数和重排序分数（加权平均）
-        for result, rerank_score, norm_rerank in zip(
-            filtered, rerank_scores, normalized_rerank
+            normalized_rerank = np.ones_like(rerank_scores)
+
+        # 合并原始分数和重排序分数（加权平均），使用归一化后的重排序分数
+        original_scores = np.fromiter(
+            (r.get("score", 0) for r in filtered), dtype=np.float64, count=len(filtered)
+        )
+        combined_scores = 0.3 * original_scores + 0.7 * normalized_rerank
+
+        for result, combined_score, rerank_score, norm_rerank in zip(
+            filtered,
+            combined_scores.tolist(),
+            rerank_scores.tolist(),
+            normalized_rerank.tolist(),
         ):
-            original_score = result.get("score", 0)
-            # 使用归一化后的重排序分数
-            combined_score = 0.3 * original_score + 0.7 * norm_rerank
             result["score"] = combined_score
-            result["rerank_score"] = float(rerank_score)
+            result["rerank_score"] = rerank_score
             result["rerank_score_normalized"] = norm_rerank
 
         # 按新分数重新排序